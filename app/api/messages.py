@@ -52,7 +52,7 @@ def _extract_ptc_tool_result(request: MessageRequest, container_id: Optional[str
 
     # Check if there's a pending execution for this container
     pending_state = ptc_service.get_pending_execution(container_id)
-    print(f"[PTC Extract] pending_state={pending_state is not None}, states_keys={list(ptc_service._execution_states.keys())}")
+    print(f"[PTC Extract] pending_state={pending_state is not None}, states_keys={list(ptc_service._ptc_sessions.keys())}")
     if not pending_state:
         print(f"[PTC Extract] No pending state for {container_id}, returning None")
         return None
@@ -282,6 +282,7 @@ async def create_message(
                             headers={
                                 "Cache-Control": "no-cache",
                                 "Connection": "keep-alive",
+                                "X-Accel-Buffering": "no",
                                 "X-Request-ID": request_id,
                                 "X-Container-ID": container_id or "",
                             },
@@ -301,6 +302,7 @@ async def create_message(
                             headers={
                                 "Cache-Control": "no-cache",
                                 "Connection": "keep-alive",
+                                "X-Accel-Buffering": "no",
                                 "X-Request-ID": request_id,
                             },
                         )
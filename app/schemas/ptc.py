@@ -193,6 +193,12 @@ class PTCExecutionState(BaseModel):
     # Preserve Claude's original response content (including thinking blocks)
     original_assistant_content: Optional[List[Any]] = None
     original_execute_code_id: Optional[str] = None  # Original execute_code tool_use ID
+    # Continuation history already sent to Bedrock by earlier code execution rounds
+    # (ends with the previous round's tool_result). Finalization appends to a copy
+    # instead of rebuilding it from the client's echoed messages.
+    messages: Optional[List[Any]] = None
+    # Bedrock tools (execute_code + direct tools) prepared when the state was created
+    cached_tools: Optional[List[Any]] = None
 
 
 # ==================== Beta Header Constants ====================
@@ -136,6 +136,9 @@ class SandboxSession:
     tool_definitions: list[dict] = field(default_factory=list)
     # Runner script version for compatibility checking
     runner_version: int = 0
+    # Cached API-facing container info as (expires_at it was built for, info);
+    # rebuilt by the PTC service when refresh() moves the expiration
+    container_info_cache: tuple[datetime, Any] | None = field(default=None, repr=False, compare=False)
 
     def is_expired(self) -> bool:
         """Check if session has expired."""
@@ -162,6 +165,9 @@ class PTCSandboxExecutor:
     def __init__(self, config: SandboxConfig | None = None):
         self.config = config or SandboxConfig()
         self._docker_client = None
+        # Set once the Docker SDK import has failed; a failed import is not
+        # cached by Python, so retrying would rescan sys.path on every check
+        self._docker_sdk_missing = False
         self._sessions: dict[str, SandboxSession] = {}
         self._sessions_lock = threading.Lock()
         self._cleanup_task: asyncio.Task | None = None
@@ -171,12 +177,17 @@ class PTCSandboxExecutor:
     def docker_client(self):
         """Lazy-load Docker client."""
         if self._docker_client is None:
+            if self._docker_sdk_missing:
+                raise DockerNotAvailableError(
+                    "Docker SDK not installed. Run: pip install docker"
+                )
             try:
                 import docker
                 self._docker_client = docker.from_env()
                 # Test connection
                 self._docker_client.ping()
             except ImportError:
+                self._docker_sdk_missing = True
                 raise DockerNotAvailableError(
                     "Docker SDK not installed. Run: pip install docker"
                 )
@@ -9,13 +9,18 @@ Orchestrates the PTC flow:
 5. Resume sandbox execution with tool results
 """
 
+import asyncio
+import itertools
 import json
 import logging
-from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
-from uuid import uuid4
+import secrets
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel
 
 from app.core.config import settings
-from app.schemas.anthropic import MessageRequest, MessageResponse
+from app.schemas.anthropic import CallerInfo, Message, MessageRequest, MessageResponse, ToolUseContent
 from app.schemas.ptc import (
     PTC_BETA_HEADER,
     PTC_TOOL_TYPE,
@@ -38,6 +43,13 @@ from app.services.ptc import (
 logger = logging.getLogger(__name__)
 
 
+def _block_field(block: Any, name: str) -> Any:
+    """Read a field from a content block dict or model without dumping it."""
+    if isinstance(block, dict):
+        return block.get(name)
+    return getattr(block, name, None)
+
+
 def _filter_non_direct_tool_calls(messages: List[Any]) -> List[Any]:
     """
     Filter out non-direct tool calls and their corresponding results from messages.
@@ -81,22 +93,19 @@ def _filter_non_direct_tool_calls(messages: List[Any]) -> List[Any]:
         if isinstance(content, str):
             continue
 
+        # Cheap scan: read fields directly instead of dumping every block
         for block in content:
-            block_dict = block if isinstance(block, dict) else (
-                block.model_dump() if hasattr(block, "model_dump") else {}
-            )
-
-            block_type = block_dict.get("type")
+            block_type = _block_field(block, "type")
 
             # Filter server_tool_use blocks (code_execution internal)
             if block_type == "server_tool_use":
-                block_id = block_dict.get("id")
+                block_id = _block_field(block, "id")
                 if block_id:
                     non_direct_tool_ids.add(block_id)
 
             # Check tool_use blocks
             if block_type == "tool_use":
-                caller = block_dict.get("caller")
+                caller = _block_field(block, "caller")
                 if caller:
                     has_caller_fields = True
                     caller_type = caller.get("type") if isinstance(caller, dict) else (
@@ -104,11 +113,11 @@ def _filter_non_direct_tool_calls(messages: List[Any]) -> List[Any]:
                     )
                     # If caller exists and is NOT "direct", filter it out
                     if caller_type and caller_type != "direct":
-                        block_id = block_dict.get("id")
+                        block_id = _block_field(block, "id")
                         if block_id:
                             non_direct_tool_ids.add(block_id)
 
-    # Only return early if nothing needs to be modified
+    # Only return early if nothing needs to be modified (the input list is returned as-is)
     if not non_direct_tool_ids and not has_caller_fields:
         return messages
 
@@ -139,9 +148,7 @@ def _filter_non_direct_tool_calls(messages: List[Any]) -> List[Any]:
         other_blocks = []
 
         for block in content:
-            block_dict = block if isinstance(block, dict) else (
-                block.model_dump() if hasattr(block, "model_dump") else {}
-            )
+            block_dict = _block_to_dict(block) or {}
 
             block_type = block_dict.get("type")
 
@@ -193,8 +200,8 @@ def _filter_non_direct_tool_calls(messages: List[Any]) -> List[Any]:
                     "content": filtered_content
                 })
             else:
-                # For Pydantic models, create a new dict
-                msg_dict = message.model_dump() if hasattr(message, "model_dump") else dict(message)
+                # For Pydantic models, create a new dict; content is replaced, so it is not dumped
+                msg_dict = message.model_dump(exclude={"content"}) if hasattr(message, "model_dump") else dict(message)
                 msg_dict["content"] = filtered_content
                 filtered_messages.append(msg_dict)
 
@@ -218,17 +225,22 @@ def _filter_content_blocks_for_bedrock(content_blocks: List[Any]) -> List[Any]:
         content_blocks: List of content block dicts
 
     Returns:
-        Filtered list of content blocks with thinking blocks first
+        Filtered list of content blocks with thinking blocks first. The input
+        list itself is returned when it is already valid for Bedrock (all
+        dict blocks, nothing removed or stripped, thinking blocks first).
     """
     # Separate thinking blocks from other blocks to ensure correct ordering
     # Bedrock requires: if any thinking blocks exist, they must come first
     thinking_blocks = []
     other_blocks = []
+    changed = False
 
     for block in content_blocks:
-        block_dict = block if isinstance(block, dict) else (
-            block.model_dump() if hasattr(block, "model_dump") else {}
-        )
+        block_dict = _block_to_dict(block)
+        if block_dict is not block:
+            changed = True
+            if block_dict is None:
+                block_dict = {}
 
         block_type = block_dict.get("type")
 
@@ -241,11 +253,13 @@ def _filter_content_blocks_for_bedrock(content_blocks: List[Any]) -> List[Any]:
         # Our code_execution is NOT a Bedrock server tool
         if block_type == "server_tool_use":
             logger.debug(f"[PTC] Filtering out server_tool_use block: {block_dict.get('name')}")
+            changed = True
             continue
 
         # Skip server_tool_result blocks
         if block_type == "server_tool_result":
             logger.debug(f"[PTC] Filtering out server_tool_result block")
+            changed = True
             continue
 
         # Handle tool_use blocks
@@ -259,18 +273,25 @@ def _filter_content_blocks_for_bedrock(content_blocks: List[Any]) -> List[Any]:
                 # These don't have corresponding tool_result in the messages we're building
                 if caller_type and caller_type != "direct":
                     logger.debug(f"[PTC] Filtering out non-direct tool_use block: {block_dict.get('id')}")
+                    changed = True
                     continue
                 # Strip 'caller' field from remaining (direct) tool_use blocks
                 block_dict = {k: v for k, v in block_dict.items() if k != "caller"}
+                changed = True
             other_blocks.append(block_dict)
             continue
 
         # Separate thinking blocks to ensure they come first
         if block_type in ("thinking", "redacted_thinking"):
+            if other_blocks:
+                changed = True
             thinking_blocks.append(block_dict)
         else:
             other_blocks.append(block_dict)
 
+    if not changed:
+        return content_blocks
+
     # Return with thinking blocks first (Bedrock requirement)
     result = thinking_blocks + other_blocks
     if thinking_blocks:
@@ -279,6 +300,345 @@ def _filter_content_blocks_for_bedrock(content_blocks: List[Any]) -> List[Any]:
     return result
 
 
+# model_dump options for blocks that are only re-serialized into SSE frames:
+# JSON-ready primitives, wire-format aliases, and no null fields
+_DUMP_OPTS = {"mode": "json", "exclude_none": True, "by_alias": True}
+
+
+# "event: <type>\ndata: " prefixes for the event types the PTC stream emits, encoded once
+_SSE_EVENT_PREFIXES = {
+    event_type: b"event: %s\ndata: " % event_type.encode()
+    for event_type in (
+        "message_start", "content_block_start", "content_block_delta",
+        "content_block_stop", "message_delta", "message_stop", "error", "ping",
+    )
+}
+
+# Upper bound for SSE chunks joined by _batch_sse_chunks
+_SSE_BATCH_MAX_BYTES = 16384
+
+# Block types relayed live from the first Bedrock stream; tool_use and other
+# blocks wait until it is known whether the turn calls execute_code
+_LIVE_BLOCK_TYPES = frozenset(("text", "thinking", "redacted_thinking"))
+
+
+def _batch_sse_chunks(*chunks: bytes, max_bytes: int = _SSE_BATCH_MAX_BYTES) -> List[bytes]:
+    """
+    Join consecutive SSE chunks so they are sent with as few writes as possible.
+
+    Chunks are joined while the result stays within max_bytes; a chunk that is
+    larger on its own is kept whole. Frame boundaries are unchanged since every
+    chunk already ends with a blank line.
+    """
+    batches = []
+    pending = b""
+    for chunk in chunks:
+        if pending and len(pending) + len(chunk) > max_bytes:
+            batches.append(pending)
+            pending = chunk
+        else:
+            pending += chunk
+    if pending:
+        batches.append(pending)
+    return batches
+
+
+# Fields copied by _block_to_dict for the block types Claude returns
+_BLOCK_FIELDS = {
+    "text": ("type", "text", "cache_control"),
+    "thinking": ("type", "thinking", "signature"),
+    "redacted_thinking": ("type", "data"),
+    "tool_use": ("type", "id", "name", "input", "caller"),
+    "server_tool_use": ("type", "id", "name", "input"),
+}
+
+
+def _block_to_dict(block: Any) -> Any:
+    """
+    Convert a response content block to a plain dict.
+
+    Known block types are projected field by field, which skips model_dump's
+    schema walk. None fields are left out (as with _DUMP_OPTS) and nested
+    models (caller) are dumped. Dicts are returned unchanged, and anything
+    that is neither a dict nor a model gives None.
+    """
+    if isinstance(block, dict):
+        return block
+    if not isinstance(block, BaseModel):
+        return None
+    fields = _BLOCK_FIELDS.get(getattr(block, "type", None))
+    if fields is None:
+        return block.model_dump(**_DUMP_OPTS)
+    block_dict = {}
+    for name in fields:
+        value = getattr(block, name, None)
+        if value is not None:
+            block_dict[name] = value.model_dump(**_DUMP_OPTS) if isinstance(value, BaseModel) else value
+    return block_dict
+
+
+# Constant SSE frames, encoded once (same framing as PTCService._format_sse_event)
+# SSE comment sent first so the response (and any proxy in front) starts flowing
+# before the sandbox or Bedrock produce the first event; clients ignore it
+_SSE_KEEPALIVE = b": keepalive\n\n"
+_SSE_MESSAGE_STOP = b'event: message_stop\ndata: {"type": "message_stop"}\n\n'
+# Template for content_block_stop frames: _SSE_CONTENT_BLOCK_STOP % index
+_SSE_CONTENT_BLOCK_STOP = b'event: content_block_stop\ndata: {"type": "content_block_stop", "index": %d}\n\n'
+
+# Templates for a text block's frames: _SSE_TEXT_BLOCK_START % index and
+# _SSE_TEXT_DELTA % (index, JSON-encoded text)
+_SSE_TEXT_BLOCK_START = (
+    b'event: content_block_start\ndata: {"type": "content_block_start", "index": %d, '
+    b'"content_block": {"type": "text", "text": ""}}\n\n'
+)
+_SSE_TEXT_DELTA = (
+    b'event: content_block_delta\ndata: {"type": "content_block_delta", "index": %d, '
+    b'"delta": {"type": "text_delta", "text": %b}}\n\n'
+)
+
+# Caller attached to tool_use blocks that Claude invoked directly (not from sandbox code)
+_DIRECT_CALLER = CallerInfo(type="direct")
+
+
+def _needs_direct_caller(block: Any) -> bool:
+    """Whether a content block is a tool_use block without a caller."""
+    return _block_field(block, "type") == "tool_use" and _block_field(block, "caller") is None
+
+
+def _generate_id(prefix: str, num_bytes: int = 6) -> str:
+    """
+    Generate a random ID such as ``toolu_<12 hex chars>``.
+
+    Draws the entropy directly instead of building a full UUID object and
+    slicing its hex form.
+    """
+    return f"{prefix}{secrets.token_hex(num_bytes)}"
+
+
+# Per-process random prefix + counter for tool IDs: unique within the process
+# (which owns the PTC session) without drawing fresh entropy for every block
+_ID_PREFIX = secrets.token_hex(4)
+_id_counter = itertools.count()
+
+
+def _sequential_id(prefix: str) -> str:
+    """Generate a process-unique ID such as ``toolu_<16 hex chars>``."""
+    return f"{prefix}{_ID_PREFIX}{next(_id_counter):08x}"
+
+
+# Builders for the content block types kept by _split_thinking_and_text (model blocks only)
+_THINKING_AND_TEXT_BUILDERS = {
+    "thinking": lambda block: {
+        "type": "thinking",
+        "thinking": getattr(block, "thinking", ""),
+        "signature": getattr(block, "signature", None),
+    },
+    "redacted_thinking": lambda block: {
+        "type": "redacted_thinking",
+        "data": getattr(block, "data", ""),
+    },
+    "text": lambda block: {
+        "type": "text",
+        "text": getattr(block, "text", ""),
+    },
+}
+
+
+def _split_thinking_and_text(blocks: List[Any]) -> Tuple[List[dict], List[dict]]:
+    """
+    Split response content into thinking blocks and text blocks in a single pass.
+
+    Blocks of any other type are dropped. Dict blocks are kept as-is, model
+    blocks are converted to plain dicts.
+
+    Returns:
+        Tuple of (thinking_blocks, text_blocks)
+    """
+    thinking_blocks = []
+    text_blocks = []
+
+    for block in blocks:
+        if type(block) is dict:
+            block_type = block.get("type")
+            block_dict = block if block_type in _THINKING_AND_TEXT_BUILDERS else None
+        else:
+            block_type = getattr(block, "type", None)
+            build = _THINKING_AND_TEXT_BUILDERS.get(block_type)
+            block_dict = build(block) if build else None
+
+        if block_dict is None:
+            continue
+        if block_type == "text":
+            text_blocks.append(block_dict)
+        else:
+            thinking_blocks.append(block_dict)
+
+    return thinking_blocks, text_blocks
+
+
+@dataclass(slots=True)
+class _NormMsg:
+    """Message fields extracted once for the continuation rebuild loop."""
+    msg: Any
+    role: Optional[str]
+    content: Any
+    is_dict: bool
+    content_types: List[str]
+    has_tool_result: bool
+
+
+def _extract_role_content(msg: Any) -> Tuple[Optional[str], Any]:
+    """
+    Get (role, content) of a message dict or model with a single type check.
+
+    Returns role=None for anything that is not a message.
+    """
+    if type(msg) is dict:
+        return msg.get("role"), msg.get("content", [])
+    return getattr(msg, "role", None), getattr(msg, "content", [])
+
+
+def _has_tool_result(content: List[Any]) -> bool:
+    """Check whether a content list holds a tool_result block, stopping at the first one."""
+    for block in content:
+        if type(block) is dict:
+            if block.get("type") == "tool_result":
+                return True
+        elif getattr(block, "type", None) == "tool_result":
+            return True
+    return False
+
+
+def _normalize_message(msg: Any) -> _NormMsg:
+    """
+    Extract role, content and block types from a message dict or model.
+
+    Messages without a role are normalized with role=None so callers can skip them.
+    """
+    role, content = _extract_role_content(msg)
+    if role is None:
+        return _NormMsg(msg, None, None, False, [], False)
+    is_dict = type(msg) is dict
+
+    content_types = []
+    if isinstance(content, list):
+        content_types = [
+            b.get("type", "unknown") if isinstance(b, dict) else b.type
+            for b in content
+            if isinstance(b, dict) or hasattr(b, "type")
+        ]
+
+    return _NormMsg(msg, role, content, is_dict, content_types, "tool_result" in content_types)
+
+
+def _parse_sse_data(frame: str) -> Optional[dict]:
+    """Parse the JSON payload of a single ``event: ...\ndata: ...`` SSE frame."""
+    _, sep, data = frame.partition("data: ")
+    if not sep:
+        return None
+    return json.loads(data)
+
+
+@dataclass(slots=True)
+class _BedrockStreamState:
+    """
+    Accumulated state of a Bedrock stream relayed by _relay_bedrock_stream.
+
+    Content blocks are rebuilt from the stream deltas so the full response is
+    available once the stream ends (e.g. to continue with code execution).
+    """
+    message: Dict[str, Any] = field(default_factory=dict)
+    blocks: List[dict] = field(default_factory=list)
+    partial_json: Dict[int, List[str]] = field(default_factory=dict)
+    stop_reason: Optional[str] = None
+    stop_sequence: Optional[str] = None
+    output_tokens: int = 0
+    forwarded_blocks: int = 0
+    # Index of the first block not relayed live; it and all later blocks are held back
+    held_from: Optional[int] = None
+    # Index of the execute_code tool_use block, recorded while relaying so the
+    # finished response doesn't need to be scanned for it again
+    execute_code_index: Optional[int] = None
+    error: Optional[dict] = None
+
+    @property
+    def holding(self) -> bool:
+        """Whether events are held back (a non-text block such as tool_use started)."""
+        return self.held_from is not None
+
+    @property
+    def held_blocks(self) -> List[dict]:
+        """Blocks that were not relayed to the client while streaming."""
+        if self.held_from is None:
+            return []
+        return self.blocks[self.held_from:]
+
+    @property
+    def execute_code_call(self) -> Optional[dict]:
+        """The execute_code tool_use block, if Claude called it."""
+        if self.execute_code_index is None:
+            return None
+        return self.blocks[self.execute_code_index]
+
+    def apply_delta(self, index: int, delta: dict) -> None:
+        """Apply a content_block_delta to the rebuilt block at index."""
+        block = self.blocks[index]
+        delta_type = delta.get("type")
+        if delta_type == "text_delta":
+            block["text"] = block.get("text", "") + delta.get("text", "")
+        elif delta_type == "thinking_delta":
+            block["thinking"] = block.get("thinking", "") + delta.get("thinking", "")
+        elif delta_type == "signature_delta":
+            block["signature"] = delta.get("signature")
+        elif delta_type == "input_json_delta":
+            self.partial_json.setdefault(index, []).append(delta.get("partial_json", ""))
+        elif delta_type == "citations_delta":
+            block.setdefault("citations", []).append(delta.get("citation"))
+
+    def finish_block(self, index: int) -> None:
+        """Decode the accumulated tool input JSON of a finished block."""
+        parts = self.partial_json.pop(index, None)
+        if parts is not None:
+            raw_input = "".join(parts)
+            try:
+                self.blocks[index]["input"] = json.loads(raw_input) if raw_input else {}
+            except json.JSONDecodeError:
+                # Tool input cut off mid-JSON (e.g. stop_reason "max_tokens")
+                self.blocks[index]["input"] = {}
+
+    def to_response(self, message_id: str, model: str) -> MessageResponse:
+        """Build the complete MessageResponse from the relayed stream."""
+        usage = self.message.get("usage") or {}
+        return MessageResponse.model_validate({
+            "id": self.message.get("id") or message_id,
+            "content": self.blocks,
+            "model": self.message.get("model") or model,
+            "stop_reason": self.stop_reason,
+            "stop_sequence": self.stop_sequence,
+            "usage": {
+                "input_tokens": usage.get("input_tokens", 0),
+                "output_tokens": self.output_tokens,
+            },
+        })
+
+
+def _to_messages(messages: List[Any]) -> List[Message]:
+    """
+    Validate message dicts into Message models.
+
+    Messages that are already Message instances are kept as-is, so a
+    continuation history only pays validation cost for newly added turns.
+    """
+    return [msg if isinstance(msg, Message) else Message.model_validate(msg) for msg in messages]
+
+
+@dataclass(slots=True)
+class _PTCSession:
+    """A sandbox execution paused on tool call(s): its state and generator."""
+    state: PTCExecutionState
+    gen: Any
+
+
 class PTCService:
     """
     Service for handling Programmatic Tool Calling requests.
@@ -293,8 +653,8 @@ class PTCService:
 
     def __init__(self):
         self._sandbox_executor: Optional[PTCSandboxExecutor] = None
-        self._execution_states: Dict[str, PTCExecutionState] = {}
-        self._execution_generators: Dict[str, Any] = {}  # Store active generators
+        # Paused executions by session ID (state and generator are always used together)
+        self._ptc_sessions: Dict[str, _PTCSession] = {}
 
     @property
     def sandbox_executor(self) -> PTCSandboxExecutor:
@@ -436,16 +796,16 @@ This significantly improves performance by executing multiple tool calls concurr
             }
         }
 
-    def prepare_bedrock_request(
+    def _prepare_bedrock_tools(
         self,
-        request: MessageRequest,
+        tools: Optional[List[Any]],
         ptc_callable_tools: List[dict]
-    ) -> MessageRequest:
+    ) -> List[dict]:
         """
-        Prepare request for Bedrock by replacing PTC tools with execute_code.
+        Build the Bedrock tool list: our execute_code tool plus the direct-callable tools.
 
-        This transforms the request to remove server-side code_execution tool
-        and add our own execute_code tool that we handle locally.
+        Continuations only need this list, so they call it directly instead of
+        preparing (dumping and re-validating) the whole request.
         """
         # Build new tools list
         new_tools = []
@@ -455,7 +815,7 @@ This significantly improves performance by executing multiple tool calls concurr
         new_tools.append(execute_code_tool)
 
         # Add any "direct" callable tools
-        for tool in (request.tools or []):
+        for tool in (tools or []):
             tool_dict = tool if isinstance(tool, dict) else tool.model_dump()
 
             # Skip code_execution server tool
@@ -475,6 +835,21 @@ This significantly improves performance by executing multiple tool calls concurr
                 tool_copy = {k: v for k, v in tool_dict.items() if k != "allowed_callers"}
                 new_tools.append(tool_copy)
 
+        return new_tools
+
+    def prepare_bedrock_request(
+        self,
+        request: MessageRequest,
+        ptc_callable_tools: List[dict]
+    ) -> MessageRequest:
+        """
+        Prepare request for Bedrock by replacing PTC tools with execute_code.
+
+        This transforms the request to remove server-side code_execution tool
+        and add our own execute_code tool that we handle locally.
+        """
+        new_tools = self._prepare_bedrock_tools(request.tools, ptc_callable_tools)
+
         # Create modified request
         request_dict = request.model_dump()
         request_dict["tools"] = new_tools
@@ -861,10 +1236,7 @@ Before writing code, verify:
                 # No code execution, return response with container info
                 # Add caller: {type: "direct"} to any direct tool_use blocks
                 response = self._add_direct_caller_to_tool_use(response)
-                container_info = ContainerInfo(
-                    id=session.session_id,
-                    expires_at=session.expires_at.isoformat()
-                )
+                container_info = self._container_info(session)
                 return response, container_info
 
         except Exception as e:
@@ -896,6 +1268,23 @@ Before writing code, verify:
 
         return session
 
+    @staticmethod
+    def _container_info(session: SandboxSession) -> ContainerInfo:
+        """
+        Get the ContainerInfo for a session.
+
+        The instance is cached on the session and reused until refresh()
+        moves the session's expiration time.
+        """
+        cached = session.container_info_cache
+        if cached is None or cached[0] != session.expires_at:
+            cached = (
+                session.expires_at,
+                ContainerInfo(id=session.session_id, expires_at=session.expires_at.isoformat()),
+            )
+            session.container_info_cache = cached
+        return cached[1]
+
     def _find_execute_code_call(self, response: MessageResponse) -> Optional[dict]:
         """Find execute_code tool call in response."""
         for block in response.content:
@@ -923,6 +1312,8 @@ Before writing code, verify:
         service_tier: str,
         ptc_callable_tools: List[dict],
         anthropic_beta: Optional[str] = None,
+        messages: Optional[List[Message]] = None,
+        continuation_tools: Optional[List[Any]] = None,
     ) -> Tuple[MessageResponse, Optional[ContainerInfo]]:
         """
         Handle code execution in sandbox.
@@ -931,194 +1322,206 @@ Before writing code, verify:
         1. Run code in sandbox
         2. If sandbox calls external tool, return tool_use to client
         3. If code completes, send result back to Claude
-        """
-        code = execute_code_call.get("input", {}).get("code", "")
-        code_execution_tool_id = f"srvtoolu_{uuid4().hex[:12]}"
-
-        # Check if there's a pending tool call for this session
-        # If so, the container is waiting for a tool result - we can't send new code
-        pending_state = self._execution_states.get(session.session_id)
-        if pending_state or session.pending_tool_call or session.is_busy:
-            reason = []
-            if pending_state:
-                reason.append(f"pending tool call ({pending_state.pending_tool_name})")
-            if session.pending_tool_call:
-                reason.append(f"session pending_tool_call ({session.pending_tool_call.tool_name})")
-            if session.is_busy:
-                reason.append("session is_busy")
-
-            logger.warning(
-                f"Session {session.session_id} in inconsistent state: {', '.join(reason)}. "
-                "Creating new session."
-            )
-            # Clean up the pending state - the old execution is abandoned
-            self._cleanup_execution_state(session.session_id)
-            # Close the old session and create a new one - container is in inconsistent state
-            await self.sandbox_executor.close_session(session.session_id)
-            # Create fresh session
-            tool_defs = [
-                {
-                    "name": t.get("name"),
-                    "description": t.get("description", ""),
-                    "input_schema": t.get("input_schema", {})
-                }
-                for t in ptc_callable_tools
-            ]
-            session = await self.sandbox_executor.create_session(tool_defs)
-            logger.info(f"Created new session {session.session_id} after cleaning up stale state")
+        4. Repeat while Claude keeps calling execute_code
 
-        logger.info(f"Executing code in sandbox:\n{code}")
+        Multi-round execution runs as a loop over a single continuation
+        history, so each round only appends its own assistant/tool_result
+        messages instead of rebuilding the whole conversation.
 
-        # Extract original assistant content (including thinking blocks) for later use
-        # This is needed when thinking is enabled - Claude requires assistant messages to start with thinking
-        original_assistant_content = []
-        for block in claude_response.content:
-            if hasattr(block, "model_dump"):
-                original_assistant_content.append(block.model_dump())
-            elif isinstance(block, dict):
-                original_assistant_content.append(block)
+        Args:
+            messages: Continuation history (validated, already filtered for
+                Bedrock) to extend. Built from original_request on the first
+                completed round when None.
+            continuation_tools: Prepared Bedrock tools. Prepared from
+                original_request on the first completed round when None.
+        """
+        while True:
+            code = execute_code_call.get("input", {}).get("code", "")
+            code_execution_tool_id = _sequential_id("srvtoolu_")
+
+            # Check if there's a pending tool call for this session
+            # If so, the container is waiting for a tool result - we can't send new code
+            pending_state = self.get_pending_execution(session.session_id)
+            if pending_state or session.pending_tool_call or session.is_busy:
+                reason = []
+                if pending_state:
+                    reason.append(f"pending tool call ({pending_state.pending_tool_name})")
+                if session.pending_tool_call:
+                    reason.append(f"session pending_tool_call ({session.pending_tool_call.tool_name})")
+                if session.is_busy:
+                    reason.append("session is_busy")
+
+                logger.warning(
+                    f"Session {session.session_id} in inconsistent state: {', '.join(reason)}. "
+                    "Creating new session."
+                )
+                # Clean up the pending state - the old execution is abandoned
+                self._cleanup_execution_state(session.session_id)
+                # Close the old session and create a new one - container is in inconsistent state
+                await self.sandbox_executor.close_session(session.session_id)
+                # Create fresh session
+                tool_defs = [
+                    {
+                        "name": t.get("name"),
+                        "description": t.get("description", ""),
+                        "input_schema": t.get("input_schema", {})
+                    }
+                    for t in ptc_callable_tools
+                ]
+                session = await self.sandbox_executor.create_session(tool_defs)
+                logger.info(f"Created new session {session.session_id} after cleaning up stale state")
 
-        # Get the original execute_code tool_use ID
-        original_execute_code_id = execute_code_call.get("id")
+            logger.info(f"Executing code in sandbox:\n{code}")
 
-        # Execute code in sandbox (using async generator pattern)
-        gen = self.sandbox_executor.execute_code(code, session)
+            # Extract original assistant content (including thinking blocks) for later use
+            # This is needed when thinking is enabled - Claude requires assistant messages to start with thinking
+            original_assistant_content = [
+                b for b in map(_block_to_dict, claude_response.content) if b is not None
+            ]
 
-        try:
-            # Get first result (either tool call, batch of tool calls, or final result)
-            result = await gen.__anext__()
-
-            while isinstance(result, (ToolCallRequest, BatchToolCallRequest)):
-                # Tool call(s) requested - return to client
-                container_info = ContainerInfo(
-                    id=session.session_id,
-                    expires_at=session.expires_at.isoformat()
-                )
+            # Get the original execute_code tool_use ID
+            original_execute_code_id = execute_code_call.get("id")
 
-                if isinstance(result, BatchToolCallRequest):
-                    # Multiple parallel tool calls
-                    logger.info(f"[PTC] Batch of {len(result)} tool calls")
-                    first_call = result.requests[0]
-                    pending_call_ids = [r.call_id for r in result.requests]
+            # Execute code in sandbox (using async generator pattern)
+            gen = self.sandbox_executor.execute_code(code, session)
 
-                    # Store execution state for resume (including original request context)
-                    state = PTCExecutionState(
-                        session_id=session.session_id,
-                        code_execution_tool_id=code_execution_tool_id,
-                        code=code,  # Store actual code for response
-                        pending_tool_call_id=first_call.call_id,  # Track first call
-                        pending_tool_name=first_call.tool_name,
-                        pending_tool_input=first_call.arguments,
-                        pending_batch_call_ids=pending_call_ids,  # Track all call IDs
-                        # Preserve original request context for finalization
-                        original_system=original_request.system,
-                        original_model=original_request.model,
-                        original_max_tokens=original_request.max_tokens,
-                        original_temperature=original_request.temperature,
-                        original_top_p=original_request.top_p,
-                        original_top_k=original_request.top_k,
-                        original_stop_sequences=original_request.stop_sequences,
-                        original_tool_choice=original_request.tool_choice,
-                        original_thinking=original_request.thinking,
-                        original_anthropic_beta=anthropic_beta,
-                        # Preserve original assistant content (including thinking blocks)
-                        original_assistant_content=original_assistant_content,
-                        original_execute_code_id=original_execute_code_id,
-                    )
-                    self._execution_states[session.session_id] = state
-                    self._execution_generators[session.session_id] = gen
+            try:
+                # Get first result (either tool call, batch of tool calls, or final result)
+                result = await gen.__anext__()
 
-                    # Mark session as having pending tool calls
-                    session.pending_tool_call = PendingToolCall(
-                        call_id=first_call.call_id,
-                        tool_name=first_call.tool_name,
-                        arguments=first_call.arguments,
-                        session_id=session.session_id,
-                        code_execution_tool_id=code_execution_tool_id
-                    )
+                while isinstance(result, (ToolCallRequest, BatchToolCallRequest)):
+                    # Tool call(s) requested - return to client
+                    container_info = self._container_info(session)
 
-                    # Build response with multiple tool_use blocks
-                    tool_use_response = self._build_batch_tool_use_response(
-                        result,
-                        code_execution_tool_id,
-                        claude_response,
-                        container_info,
-                        code=code
-                    )
+                    if isinstance(result, BatchToolCallRequest):
+                        # Multiple parallel tool calls
+                        logger.info(f"[PTC] Batch of {len(result)} tool calls")
+                        first_call = result.requests[0]
+                        pending_call_ids = [r.call_id for r in result.requests]
 
-                    return tool_use_response, container_info
+                        # Store execution state for resume (including original request context)
+                        state = PTCExecutionState(
+                            session_id=session.session_id,
+                            code_execution_tool_id=code_execution_tool_id,
+                            code=code,  # Store actual code for response
+                            pending_tool_call_id=first_call.call_id,  # Track first call
+                            pending_tool_name=first_call.tool_name,
+                            pending_tool_input=first_call.arguments,
+                            pending_batch_call_ids=pending_call_ids,  # Track all call IDs
+                            # Preserve original request context for finalization
+                            original_system=original_request.system,
+                            original_model=original_request.model,
+                            original_max_tokens=original_request.max_tokens,
+                            original_temperature=original_request.temperature,
+                            original_top_p=original_request.top_p,
+                            original_top_k=original_request.top_k,
+                            original_stop_sequences=original_request.stop_sequences,
+                            original_tool_choice=original_request.tool_choice,
+                            original_thinking=original_request.thinking,
+                            original_anthropic_beta=anthropic_beta,
+                            # Preserve original assistant content (including thinking blocks)
+                            original_assistant_content=original_assistant_content,
+                            original_execute_code_id=original_execute_code_id,
+                            messages=messages,
+                        )
+                        # Park the execution and mark the session as waiting on the tool call
+                        self._register_pending_execution(session, state, gen, first_call)
+
+                        # Build response with multiple tool_use blocks
+                        tool_use_response = self._build_batch_tool_use_response(
+                            result,
+                            code_execution_tool_id,
+                            claude_response,
+                            container_info,
+                            code=code
+                        )
 
-                else:
-                    # Single tool call (original behavior)
-                    # Store execution state for resume (including original request context)
-                    state = PTCExecutionState(
-                        session_id=session.session_id,
-                        code_execution_tool_id=code_execution_tool_id,
-                        code=code,  # Store actual code for response
-                        pending_tool_call_id=result.call_id,
-                        pending_tool_name=result.tool_name,
-                        pending_tool_input=result.arguments,
-                        # Preserve original request context for finalization
-                        original_system=original_request.system,
-                        original_model=original_request.model,
-                        original_max_tokens=original_request.max_tokens,
-                        original_temperature=original_request.temperature,
-                        original_top_p=original_request.top_p,
-                        original_top_k=original_request.top_k,
-                        original_stop_sequences=original_request.stop_sequences,
-                        original_tool_choice=original_request.tool_choice,
-                        original_thinking=original_request.thinking,
-                        original_anthropic_beta=anthropic_beta,
-                        # Preserve original assistant content (including thinking blocks)
-                        original_assistant_content=original_assistant_content,
-                        original_execute_code_id=original_execute_code_id,
-                    )
-                    self._execution_states[session.session_id] = state
-                    self._execution_generators[session.session_id] = gen
+                        return tool_use_response, container_info
 
-                    # Also mark the session itself as having a pending tool call
-                    session.pending_tool_call = PendingToolCall(
-                        call_id=result.call_id,
-                        tool_name=result.tool_name,
-                        arguments=result.arguments,
-                        session_id=session.session_id,
-                        code_execution_tool_id=code_execution_tool_id
-                    )
+                    else:
+                        # Single tool call (original behavior)
+                        # Store execution state for resume (including original request context)
+                        state = PTCExecutionState(
+                            session_id=session.session_id,
+                            code_execution_tool_id=code_execution_tool_id,
+                            code=code,  # Store actual code for response
+                            pending_tool_call_id=result.call_id,
+                            pending_tool_name=result.tool_name,
+                            pending_tool_input=result.arguments,
+                            # Preserve original request context for finalization
+                            original_system=original_request.system,
+                            original_model=original_request.model,
+                            original_max_tokens=original_request.max_tokens,
+                            original_temperature=original_request.temperature,
+                            original_top_p=original_request.top_p,
+                            original_top_k=original_request.top_k,
+                            original_stop_sequences=original_request.stop_sequences,
+                            original_tool_choice=original_request.tool_choice,
+                            original_thinking=original_request.thinking,
+                            original_anthropic_beta=anthropic_beta,
+                            # Preserve original assistant content (including thinking blocks)
+                            original_assistant_content=original_assistant_content,
+                            original_execute_code_id=original_execute_code_id,
+                            messages=messages,
+                        )
+                        # Park the execution and mark the session as waiting on the tool call
+                        self._register_pending_execution(session, state, gen, result)
+
+                        # Build response with tool_use and caller info
+                        tool_use_response = self._build_tool_use_response(
+                            result,
+                            code_execution_tool_id,
+                            claude_response,
+                            container_info,
+                            code=code
+                        )
 
-                    # Build response with tool_use and caller info
-                    tool_use_response = self._build_tool_use_response(
-                        result,
-                        code_execution_tool_id,
-                        claude_response,
-                        container_info,
-                        code=code
-                    )
+                        return tool_use_response, container_info
 
-                    return tool_use_response, container_info
+                # Code completed - result is ExecutionResult
+                if not isinstance(result, ExecutionResult):
+                    raise SandboxError(f"Unexpected result type: {type(result)}")
 
-            # Code completed - result is ExecutionResult
-            if isinstance(result, ExecutionResult):
                 # Close the generator to trigger its finally block (clears is_busy)
                 await gen.aclose()
                 session.is_busy = False  # Explicitly clear just in case
-                # Send result back to Claude
-                return await self._complete_code_execution(
-                    result,
-                    execute_code_call,
-                    claude_response,
-                    original_request,
-                    bedrock_service,
-                    request_id,
-                    service_tier,
-                    session,
-                    ptc_callable_tools,
-                    anthropic_beta,
-                )
 
-        except StopAsyncIteration:
-            # Generator completed without yielding
-            logger.warning("Sandbox generator completed unexpectedly")
-            raise SandboxError("Code execution completed unexpectedly")
+            except StopAsyncIteration:
+                # Generator completed without yielding
+                logger.warning("Sandbox generator completed unexpectedly")
+                raise SandboxError("Code execution completed unexpectedly")
+
+            if continuation_tools is None:
+                continuation_tools = self._prepare_bedrock_tools(original_request.tools, ptc_callable_tools)
+
+            # Send result back to Claude
+            final_response, messages = await self._complete_code_execution(
+                result,
+                execute_code_call,
+                claude_response,
+                original_request,
+                bedrock_service,
+                request_id,
+                service_tier,
+                continuation_tools,
+                anthropic_beta,
+                messages=messages,
+            )
+
+            # Check if Claude called execute_code again
+            next_execute_code = self._find_execute_code_call(final_response)
+
+            if not next_execute_code:
+                # Add caller: {type: "direct"} to any direct tool_use blocks
+                final_response = self._add_direct_caller_to_tool_use(final_response)
+
+                container_info = self._container_info(session)
+
+                return final_response, container_info
+
+            # Multi-round code execution: run the next execute_code call
+            execute_code_call = next_execute_code
+            claude_response = final_response
 
     async def resume_execution(
         self,
@@ -1139,11 +1542,11 @@ Before writing code, verify:
             - next_result: Either ToolCallRequest or ExecutionResult
             - is_complete: True if execution is complete
         """
-        state = self._execution_states.get(session_id)
-        gen = self._execution_generators.get(session_id)
+        pending = self._ptc_sessions.get(session_id)
 
-        if not state or not gen:
+        if pending is None:
             raise ValueError(f"No pending execution for session {session_id}")
+        state, gen = pending.state, pending.gen
 
         try:
             if is_error:
@@ -1215,14 +1618,14 @@ Before writing code, verify:
         Returns:
             Tuple of (response, container_info)
         """
-        state = self._execution_states.get(session_id)
+        state = self.get_pending_execution(session_id)
         if not state:
             # Provide detailed error for multi-instance routing issues
             import os
             instance_id = os.environ.get('HOSTNAME', os.environ.get('COMPUTERNAME', 'unknown'))
 
             logger.error(f"[PTC] Session {session_id} not found on instance {instance_id}")
-            logger.error(f"[PTC] Active sessions on this instance: {list(self._execution_states.keys())}")
+            logger.error(f"[PTC] Active sessions on this instance: {list(self._ptc_sessions.keys())}")
 
             raise ValueError(
                 f"PTC session '{session_id}' not found on this instance (instance_id: {instance_id}). "
@@ -1231,7 +1634,7 @@ Before writing code, verify:
                 f"(1) ALB sticky session expired (session timeout: {settings.ptc_session_timeout}s), "
                 f"(2) Instance was restarted and lost in-memory sessions, "
                 f"(3) Load balancer routed continuation request to a different instance. "
-                f"Active sessions on this instance: {len(self._execution_states)}. "
+                f"Active sessions on this instance: {len(self._ptc_sessions)}. "
                 f"Solution: Ensure ALB sticky sessions are enabled with sufficient duration, "
                 f"or create a new PTC session."
             )
@@ -1260,10 +1663,7 @@ Before writing code, verify:
 
         if not is_complete and isinstance(result, (ToolCallRequest, BatchToolCallRequest)):
             # Tool call(s) - return to client
-            container_info = ContainerInfo(
-                id=session_id,
-                expires_at=session.expires_at.isoformat()
-            )
+            container_info = self._container_info(session)
 
             if isinstance(result, BatchToolCallRequest):
                 # Multiple parallel tool calls
@@ -1276,7 +1676,6 @@ Before writing code, verify:
                 state.pending_tool_call_id = first_call.call_id
                 state.pending_tool_name = first_call.tool_name
                 state.pending_tool_input = first_call.arguments
-                self._execution_states[session_id] = state
 
                 # Update session's pending tool call
                 session.pending_tool_call = PendingToolCall(
@@ -1311,7 +1710,6 @@ Before writing code, verify:
 
                 # Clear batch call IDs since this is single
                 state.pending_batch_call_ids = None
-                self._execution_states[session_id] = state
 
                 # Build minimal response with tool_use
                 response = self._build_tool_use_response_minimal(
@@ -1328,10 +1726,7 @@ Before writing code, verify:
             # Execution complete - call Claude to get final response
             logger.info(f"[PTC] Sandbox execution completed: success={result.success}")
 
-            container_info = ContainerInfo(
-                id=session_id,
-                expires_at=session.expires_at.isoformat()
-            )
+            container_info = self._container_info(session)
 
             # Call Claude with the code execution result to get final response
             # Pass the saved execution state to preserve original request context
@@ -1388,7 +1783,7 @@ Before writing code, verify:
         ]
 
         return MessageResponse(
-            id=f"msg_{uuid4().hex}",
+            id=_generate_id("msg_", 16),
             type="message",
             role="assistant",
             content=content,
@@ -1473,8 +1868,11 @@ Before writing code, verify:
         )
 
         has_system = effective_system is not None
-        logger.info(f"[PTC] Finalizing code execution, sending result to Claude")
-        logger.info(f"[PTC] Effective parameters - Has system: {has_system}, Model: {effective_model}, Beta: {effective_anthropic_beta}")
+        info_enabled = logger.isEnabledFor(logging.INFO)
+        # Content types of each continuation message, recorded as messages are appended (INFO only)
+        types_by_msg: List[Optional[List[str]]] = []
+        logger.info("[PTC] Finalizing code execution, sending result to Claude")
+        logger.info("[PTC] Effective parameters - Has system: %s, Model: %s, Beta: %s", has_system, effective_model, effective_anthropic_beta)
 
         # Build continuation messages
         # The original_request.messages contains the conversation history echoed by the client
@@ -1498,114 +1896,130 @@ Before writing code, verify:
             #
             # This avoids having an incomplete assistant message (without thinking) in the history.
 
-            messages = []
-            msg_list = list(original_request.messages)
+            if execution_state.messages is not None:
+                # Later round: the history sent so far is on the state, only this round is appended
+                messages = list(execution_state.messages)
+                msg_list = []
+                if info_enabled:
+                    for msg in messages:
+                        content = msg.get("content") if isinstance(msg, dict) else getattr(msg, "content", [])
+                        types_by_msg.append(
+                            [b.get("type") if isinstance(b, dict) else getattr(b, "type", "?") for b in content]
+                            if isinstance(content, list) else None
+                        )
+            else:
+                messages = []
+                msg_list = list(original_request.messages)
 
-            logger.info(f"[PTC] Input messages count: {len(msg_list)}")
+            logger.info("[PTC] Input messages count: %d", len(msg_list))
+
+            # Normalize every message once: role, content and block types are
+            # extracted in a single pass and reused by the checks below
+            norm = [_normalize_message(msg) for msg in msg_list]
 
             # Find the index of the last assistant message (which is the incomplete one we sent)
-            last_assistant_idx = -1
-            for i in range(len(msg_list) - 1, -1, -1):
-                msg = msg_list[i]
-                if isinstance(msg, dict):
-                    role = msg.get("role")
-                elif hasattr(msg, "role"):
-                    role = msg.role
-                else:
-                    continue
-                if role == "assistant":
-                    last_assistant_idx = i
-                    break
-
-            logger.info(f"[PTC] Last assistant message index: {last_assistant_idx}")
-
-            for i, msg in enumerate(msg_list):
-                if isinstance(msg, dict):
-                    role = msg.get("role")
-                    content = msg.get("content", [])
-                elif hasattr(msg, "role"):
-                    role = msg.role
-                    content = msg.content if hasattr(msg, "content") else []
-                else:
+            last_assistant_idx = next(
+                (i for i in range(len(norm) - 1, -1, -1) if norm[i].role == "assistant"), -1
+            )
+
+            logger.info("[PTC] Last assistant message index: %d", last_assistant_idx)
+
+            # Bind hot-loop lookups to locals (LOAD_FAST instead of global/attribute lookups)
+            log_info = logger.info
+            filter_blocks = _filter_content_blocks_for_bedrock
+            append_message = messages.append
+
+            for i, n in enumerate(norm):
+                if n.role is None:
                     continue
+                role = n.role
 
                 # Log each message for debugging
-                content_types = []
-                if isinstance(content, list):
-                    for b in content:
-                        if isinstance(b, dict):
-                            content_types.append(b.get("type", "unknown"))
-                        elif hasattr(b, "type"):
-                            content_types.append(b.type)
-                logger.info(f"[PTC] Input msg[{i}]: role={role}, content_types={content_types}")
+                log_info("[PTC] Input msg[%d]: role=%s, content_types=%s", i, role, n.content_types)
 
                 # Skip the LAST assistant message (it's incomplete, missing thinking blocks)
                 # Previous assistant messages from earlier turns are valid and should be kept
                 if role == "assistant" and i == last_assistant_idx:
-                    logger.info(f"[PTC] Skipping msg[{i}] (last assistant)")
+                    log_info("[PTC] Skipping msg[%d] (last assistant)", i)
                     continue
 
                 # Skip user messages containing tool_result (those are for internal tools)
-                if role == "user" and isinstance(content, list):
-                    has_tool_result = any(
-                        (isinstance(b, dict) and b.get("type") == "tool_result") or
-                        (hasattr(b, "type") and b.type == "tool_result")
-                        for b in content
-                    )
-                    if has_tool_result:
-                        logger.info(f"[PTC] Skipping msg[{i}] (user with tool_result)")
-                        continue
+                if role == "user" and n.has_tool_result:
+                    log_info("[PTC] Skipping msg[%d] (user with tool_result)", i)
+                    continue
 
-                msg_dict = msg if isinstance(msg, dict) else msg.model_dump()
+                msg_dict = n.msg if n.is_dict else n.msg.model_dump()
+                msg_types = n.content_types if isinstance(n.content, list) else None
 
                 # Filter assistant message content blocks for Bedrock compatibility
                 # Earlier assistant messages may contain server_tool_use blocks from previous code execution rounds
                 if role == "assistant" and isinstance(msg_dict.get("content"), list):
-                    msg_dict = dict(msg_dict)  # Make a copy to avoid mutating original
-                    original_types = [b.get("type") if isinstance(b, dict) else getattr(b, "type", "?") for b in msg_dict["content"]]
-                    msg_dict["content"] = _filter_content_blocks_for_bedrock(msg_dict["content"])
-                    filtered_types = [b.get("type") if isinstance(b, dict) else getattr(b, "type", "?") for b in msg_dict["content"]]
-                    logger.info(f"[PTC] Filtered msg[{i}] assistant content: {original_types} -> {filtered_types}")
+                    original_types = n.content_types
+                    new_content = filter_blocks(msg_dict["content"])
+                    if new_content is not msg_dict["content"]:
+                        # Copy only when filtering changed something, to avoid mutating the original
+                        msg_dict = {**msg_dict, "content": new_content}
+                    if info_enabled:
+                        msg_types = [b.get("type") if isinstance(b, dict) else getattr(b, "type", "?") for b in msg_dict["content"]]
+                        log_info("[PTC] Filtered msg[%d] assistant content: %s -> %s", i, original_types, msg_types)
 
                     # Skip messages that end up with empty content after filtering
                     # Bedrock rejects messages with empty content
                     if not msg_dict["content"]:
-                        logger.info(f"[PTC] Skipping msg[{i}] (empty content after filtering)")
+                        log_info("[PTC] Skipping msg[%d] (empty content after filtering)", i)
                         continue
 
-                messages.append(msg_dict)
-                logger.info(f"[PTC] Kept msg[{i}] as messages[{len(messages)-1}]")
+                append_message(msg_dict)
+                if info_enabled:
+                    types_by_msg.append(msg_types)
+                log_info("[PTC] Kept msg[%d] as messages[%d]", i, len(messages) - 1)
 
-            logger.info(f"[PTC] Kept {len(messages)} messages total")
+            logger.info("[PTC] Kept %d messages total", len(messages))
 
             # Append our stored assistant content (which includes thinking blocks)
             # Filter out server_tool_use/server_tool_result blocks - they're not valid for Bedrock
-            original_content_types = [b.get("type") if isinstance(b, dict) else getattr(b, "type", "?") for b in execution_state.original_assistant_content]
             filtered_assistant_content = _filter_content_blocks_for_bedrock(
                 execution_state.original_assistant_content
             )
-            filtered_content_types = [b.get("type") if isinstance(b, dict) else getattr(b, "type", "?") for b in filtered_assistant_content]
             messages.append({
                 "role": "assistant",
                 "content": filtered_assistant_content
             })
-            logger.info(f"[PTC] Appended stored assistant content as messages[{len(messages)-1}]: {original_content_types} -> {filtered_content_types}")
+            if info_enabled:
+                original_content_types = [b.get("type") if isinstance(b, dict) else getattr(b, "type", "?") for b in execution_state.original_assistant_content]
+                filtered_content_types = [b.get("type") if isinstance(b, dict) else getattr(b, "type", "?") for b in filtered_assistant_content]
+                types_by_msg.append(filtered_content_types)
+                logger.info(
+                    "[PTC] Appended stored assistant content as messages[%d]: %s -> %s",
+                    len(messages) - 1, original_content_types, filtered_content_types,
+                )
             # Use the original execute_code ID for the tool_result
             execute_code_id = execution_state.original_execute_code_id or f"toolu_{code_execution_tool_id[-12:]}"
         else:
             # Fallback: no stored assistant content, use client's messages directly
             # This path is used when thinking is NOT enabled
-            messages = _filter_non_direct_tool_calls(list(original_request.messages))
             execute_code_id = f"toolu_{code_execution_tool_id[-12:]}"
-            messages.append({
-                "role": "assistant",
-                "content": [{
-                    "type": "tool_use",
-                    "id": execute_code_id,
-                    "name": "execute_code",
-                    "input": {"code": code}
-                }]
-            })
+            messages = [
+                *_filter_non_direct_tool_calls(original_request.messages),
+                {
+                    "role": "assistant",
+                    "content": [{
+                        "type": "tool_use",
+                        "id": execute_code_id,
+                        "name": "execute_code",
+                        "input": {"code": code}
+                    }]
+                },
+            ]
+            if info_enabled:
+                # Content types of the filtered client history are only known after filtering
+                for msg in messages[:-1]:
+                    content = msg.get("content") if isinstance(msg, dict) else getattr(msg, "content", [])
+                    types_by_msg.append(
+                        [b.get("type") if isinstance(b, dict) else getattr(b, "type", "?") for b in content]
+                        if isinstance(content, list) else None
+                    )
+                types_by_msg.append(["tool_use"])
 
         # Add tool result for the execute_code call
         messages.append({
@@ -1616,18 +2030,21 @@ Before writing code, verify:
                 "content": tool_result_content
             }]
         })
-        logger.info(f"[PTC] Appended tool_result as messages[{len(messages)-1}]")
-
-        # Log final messages summary
-        logger.info(f"[PTC] Final messages array ({len(messages)} messages):")
-        for idx, msg in enumerate(messages):
-            role = msg.get("role") if isinstance(msg, dict) else getattr(msg, "role", "?")
-            content = msg.get("content") if isinstance(msg, dict) else getattr(msg, "content", [])
-            if isinstance(content, list):
-                types = [b.get("type") if isinstance(b, dict) else getattr(b, "type", "?") for b in content]
-                logger.info(f"[PTC]   messages[{idx}]: role={role}, content_types={types}")
-            else:
-                logger.info(f"[PTC]   messages[{idx}]: role={role}, content=str")
+        logger.info("[PTC] Appended tool_result as messages[%d]", len(messages) - 1)
+
+        # Log final messages summary from the content types recorded while building messages
+        if info_enabled:
+            types_by_msg.append(["tool_result"])
+            logger.info("[PTC] Final messages array (%d messages):", len(messages))
+            for idx, (msg, types) in enumerate(zip(messages, types_by_msg, strict=True)):
+                role = msg.get("role") if isinstance(msg, dict) else getattr(msg, "role", "?")
+                if types is not None:
+                    logger.info("[PTC]   messages[%d]: role=%s, content_types=%s", idx, role, types)
+                else:
+                    logger.info("[PTC]   messages[%d]: role=%s, content=str", idx, role)
+
+        # Prepare tools once: shared by the continuation request and the recursive branch
+        prepared_tools = self._prepare_bedrock_tools(original_request.tools, ptc_callable_tools)
 
         # Create continuation request using effective (preserved) parameters
         continuation_request = MessageRequest(
@@ -1639,24 +2056,25 @@ Before writing code, verify:
             top_p=effective_top_p,
             top_k=effective_top_k,
             stop_sequences=effective_stop_sequences,
-            tools=self.prepare_bedrock_request(original_request, ptc_callable_tools).tools,
+            tools=prepared_tools,
             tool_choice=effective_tool_choice,
             thinking=effective_thinking,
         )
 
         # Debug: Verify MessageRequest didn't reorder content after Pydantic validation
-        logger.info(f"[PTC] After MessageRequest creation, checking messages:")
-        for idx, msg in enumerate(continuation_request.messages):
-            content = msg.content
-            if isinstance(content, list):
-                types = [getattr(b, "type", "?") if hasattr(b, "type") else b.get("type", "?") for b in content]
-                logger.info(f"[PTC]   continuation_request.messages[{idx}]: role={msg.role}, content_types={types}")
-                # Extra detail for messages[1] if it's assistant
-                if idx == 1 and msg.role == "assistant":
-                    logger.info(f"[PTC]   DETAIL messages[1].content:")
-                    for i, block in enumerate(content):
-                        block_type = getattr(block, "type", "?") if hasattr(block, "type") else block.get("type", "?")
-                        logger.info(f"[PTC]     [{i}] type={block_type}, block={block}")
+        if info_enabled:
+            logger.info("[PTC] After MessageRequest creation, checking messages:")
+            for idx, msg in enumerate(continuation_request.messages):
+                content = msg.content
+                if isinstance(content, list):
+                    types = [getattr(b, "type", "?") if hasattr(b, "type") else b.get("type", "?") for b in content]
+                    logger.info("[PTC]   continuation_request.messages[%d]: role=%s, content_types=%s", idx, msg.role, types)
+                    # Extra detail for messages[1] if it's assistant
+                    if idx == 1 and msg.role == "assistant":
+                        logger.info("[PTC]   DETAIL messages[1].content:")
+                        for i, block in enumerate(content):
+                            block_type = getattr(block, "type", "?") if hasattr(block, "type") else block.get("type", "?")
+                            logger.info("[PTC]     [%d] type=%s, block=%s", i, block_type, block)
 
         # Call Bedrock to get Claude's final response (with preserved beta header)
         final_response = await bedrock_service.invoke_model(
@@ -1667,41 +2085,27 @@ Before writing code, verify:
         next_execute_code = self._find_execute_code_call(final_response)
 
         if next_execute_code:
-            # Recursive call for multi-round code execution
-            # Build request with effective (preserved) parameters
-            # Use prepare_bedrock_request to filter out code_execution_20250825 tool type
-            recursive_request = MessageRequest(
-                model=effective_model,
-                messages=messages,
-                max_tokens=effective_max_tokens,
-                system=effective_system,
-                temperature=effective_temperature,
-                top_p=effective_top_p,
-                top_k=effective_top_k,
-                stop_sequences=effective_stop_sequences,
-                tools=self.prepare_bedrock_request(original_request, ptc_callable_tools).tools,
-                tool_choice=effective_tool_choice,
-                thinking=effective_thinking,
-            )
+            # Multi-round code execution: hand the history over to the code execution loop.
+            # continuation_request already carries the effective (preserved) parameters and
+            # the prepared tools, so it serves as the request context without rebuilding it.
             return await self._handle_code_execution(
                 next_execute_code,
                 final_response,
                 session,
-                recursive_request,
+                continuation_request,
                 bedrock_service,
                 request_id,
                 service_tier,
                 ptc_callable_tools,
                 effective_anthropic_beta,  # Pass preserved beta header
+                messages=list(continuation_request.messages),
+                continuation_tools=prepared_tools,
             )
 
         # Add caller: {type: "direct"} to any direct tool_use blocks
         final_response = self._add_direct_caller_to_tool_use(final_response)
 
-        container_info = ContainerInfo(
-            id=session.session_id,
-            expires_at=session.expires_at.isoformat()
-        )
+        container_info = self._container_info(session)
 
         return final_response, container_info
 
@@ -1725,7 +2129,7 @@ Before writing code, verify:
         content = [
             {
                 "type": "tool_use",
-                "id": f"toolu_{uuid4().hex[:12]}",
+                "id": _sequential_id("toolu_"),
                 "name": tool_request.tool_name,
                 "input": tool_request.arguments,
                 "caller": {
@@ -1736,7 +2140,7 @@ Before writing code, verify:
         ]
 
         return MessageResponse(
-            id=f"msg_{uuid4().hex}",
+            id=_generate_id("msg_", 16),
             type="message",
             role="assistant",
             content=content,
@@ -1778,10 +2182,10 @@ Before writing code, verify:
                 }
             })
 
-        logger.info(f"[PTC] Built batch minimal response with {len(batch_request)} tool calls (continuation, no server_tool_use)")
+        logger.info("[PTC] Built batch minimal response with %d tool calls (continuation, no server_tool_use)", len(batch_request))
 
         return MessageResponse(
-            id=f"msg_{uuid4().hex}",
+            id=_generate_id("msg_", 16),
             type="message",
             role="assistant",
             content=content,
@@ -1810,19 +2214,22 @@ Before writing code, verify:
             tool_result_content = f"Error: {result.stderr}"
 
         # Build continuation messages
-        # Filter out non-direct tool calls and their results from history
-        messages = _filter_non_direct_tool_calls(list(original_request.messages))
+        # Filter out non-direct tool calls and their results from history, then
+        # add tool result for the server_tool_use (code_execution) in one sized list
+        messages = [
+            *_filter_non_direct_tool_calls(original_request.messages),
+            {
+                "role": "user",
+                "content": [{
+                    "type": "tool_result",
+                    "tool_use_id": code_execution_tool_id,
+                    "content": tool_result_content
+                }]
+            },
+        ]
 
-        # Add tool result for the server_tool_use (code_execution)
-        # Find the last assistant message with server_tool_use and add result
-        messages.append({
-            "role": "user",
-            "content": [{
-                "type": "tool_result",
-                "tool_use_id": code_execution_tool_id,
-                "content": tool_result_content
-            }]
-        })
+        # Prepare tools once: shared by the continuation request and the recursive branch
+        prepared_tools = self._prepare_bedrock_tools(original_request.tools, ptc_callable_tools)
 
         # Create continuation request
         continuation_request = MessageRequest(
@@ -1834,7 +2241,7 @@ Before writing code, verify:
             top_p=original_request.top_p,
             top_k=original_request.top_k,
             stop_sequences=original_request.stop_sequences,
-            tools=self.prepare_bedrock_request(original_request, ptc_callable_tools).tools,
+            tools=prepared_tools,
             tool_choice=original_request.tool_choice,
             thinking=original_request.thinking,
         )
@@ -1848,36 +2255,36 @@ Before writing code, verify:
         next_execute_code = self._find_execute_code_call(final_response)
 
         if next_execute_code:
-            # Recursive call for multi-round code execution
-            # Build request with filtered tools (code_execution_20250825 removed)
-            recursive_request_dict = original_request.model_dump()
-            recursive_request_dict["messages"] = messages
-            recursive_request_dict["tools"] = self.prepare_bedrock_request(original_request, ptc_callable_tools).tools
+            # Multi-round code execution: continue in the code execution loop
+            # Copy the request with the validated history and filtered tools
+            # (code_execution_20250825 removed) instead of dumping and re-validating it
+            recursive_request = original_request.model_copy(update={
+                "messages": continuation_request.messages,
+                "tools": continuation_request.tools,
+            })
             return await self._handle_code_execution(
                 next_execute_code,
                 final_response,
                 session,
-                MessageRequest(**recursive_request_dict),
+                recursive_request,
                 bedrock_service,
                 request_id,
                 service_tier,
-                ptc_callable_tools
+                ptc_callable_tools,
+                messages=list(continuation_request.messages),
+                continuation_tools=prepared_tools,
             )
 
         # Add caller: {type: "direct"} to any direct tool_use blocks
         final_response = self._add_direct_caller_to_tool_use(final_response)
 
-        container_info = ContainerInfo(
-            id=session.session_id,
-            expires_at=session.expires_at.isoformat()
-        )
+        container_info = self._container_info(session)
 
         return final_response, container_info
 
     def _cleanup_execution_state(self, session_id: str) -> None:
         """Clean up execution state."""
-        self._execution_states.pop(session_id, None)
-        self._execution_generators.pop(session_id, None)
+        self._ptc_sessions.pop(session_id, None)
         # Also clear session's pending_tool_call if session exists
         session = self.sandbox_executor.get_session(session_id)
         if session:
@@ -1895,37 +2302,8 @@ Before writing code, verify:
         """Build response with tool_use block including caller info."""
         # Create new content with tool_use
         # IMPORTANT: Thinking blocks must come first for Bedrock compatibility
-        thinking_blocks = []
-        other_blocks = []
-
-        # Separate thinking blocks from other content (text only)
-        for block in original_response.content:
-            if hasattr(block, "type"):
-                block_type = block.type
-                if block_type in ("thinking", "redacted_thinking"):
-                    # Include thinking blocks for client to echo back correctly
-                    if block_type == "thinking":
-                        thinking_blocks.append({
-                            "type": "thinking",
-                            "thinking": block.thinking if hasattr(block, "thinking") else "",
-                            "signature": block.signature if hasattr(block, "signature") else None
-                        })
-                    else:
-                        thinking_blocks.append({
-                            "type": "redacted_thinking",
-                            "data": block.data if hasattr(block, "data") else ""
-                        })
-                elif block_type == "text":
-                    other_blocks.append({
-                        "type": "text",
-                        "text": block.text if hasattr(block, "text") else ""
-                    })
-            elif isinstance(block, dict):
-                block_type = block.get("type")
-                if block_type in ("thinking", "redacted_thinking"):
-                    thinking_blocks.append(block)
-                elif block_type == "text":
-                    other_blocks.append(block)
+        # Thinking blocks are included for the client to echo back correctly
+        thinking_blocks, other_blocks = _split_thinking_and_text(original_response.content)
 
         # Combine: thinking first, then text
         content = thinking_blocks + other_blocks
@@ -1941,7 +2319,7 @@ Before writing code, verify:
         # Add tool_use with caller info
         content.append({
             "type": "tool_use",
-            "id": f"toolu_{uuid4().hex[:12]}",
+            "id": _sequential_id("toolu_"),
             "name": tool_request.tool_name,
             "input": tool_request.arguments,
             "caller": {
@@ -1959,11 +2337,13 @@ Before writing code, verify:
             "model": original_response.model,
             "stop_reason": "tool_use",
             "stop_sequence": None,
-            "usage": original_response.usage.model_dump() if hasattr(original_response.usage, "model_dump") else original_response.usage,
+            # Usage instance is passed through as-is (instances are not revalidated)
+            "usage": original_response.usage,
         }
 
-        content_types = [b.get("type") if isinstance(b, dict) else getattr(b, "type", "?") for b in content]
-        logger.info(f"[PTC] Built tool_use response: {len(thinking_blocks)} thinking blocks first, content_types={content_types}")
+        if logger.isEnabledFor(logging.INFO):
+            content_types = [b.get("type") if isinstance(b, dict) else getattr(b, "type", "?") for b in content]
+            logger.info("[PTC] Built tool_use response: %d thinking blocks first, content_types=%s", len(thinking_blocks), content_types)
         return MessageResponse(**response_dict)
 
     def _build_batch_tool_use_response(
@@ -1977,37 +2357,8 @@ Before writing code, verify:
         """Build response with multiple tool_use blocks for parallel tool calls."""
         # Create new content
         # IMPORTANT: Thinking blocks must come first for Bedrock compatibility
-        thinking_blocks = []
-        other_blocks = []
-
-        # Separate thinking blocks from other content (text only)
-        for block in original_response.content:
-            if hasattr(block, "type"):
-                block_type = block.type
-                if block_type in ("thinking", "redacted_thinking"):
-                    # Include thinking blocks for client to echo back correctly
-                    if block_type == "thinking":
-                        thinking_blocks.append({
-                            "type": "thinking",
-                            "thinking": block.thinking if hasattr(block, "thinking") else "",
-                            "signature": block.signature if hasattr(block, "signature") else None
-                        })
-                    else:
-                        thinking_blocks.append({
-                            "type": "redacted_thinking",
-                            "data": block.data if hasattr(block, "data") else ""
-                        })
-                elif block_type == "text":
-                    other_blocks.append({
-                        "type": "text",
-                        "text": block.text if hasattr(block, "text") else ""
-                    })
-            elif isinstance(block, dict):
-                block_type = block.get("type")
-                if block_type in ("thinking", "redacted_thinking"):
-                    thinking_blocks.append(block)
-                elif block_type == "text":
-                    other_blocks.append(block)
+        # Thinking blocks are included for the client to echo back correctly
+        thinking_blocks, other_blocks = _split_thinking_and_text(original_response.content)
 
         # Combine: thinking first, then text
         content = thinking_blocks + other_blocks
@@ -2042,11 +2393,16 @@ Before writing code, verify:
             "model": original_response.model,
             "stop_reason": "tool_use",
             "stop_sequence": None,
-            "usage": original_response.usage.model_dump() if hasattr(original_response.usage, "model_dump") else original_response.usage,
+            # Usage instance is passed through as-is (instances are not revalidated)
+            "usage": original_response.usage,
         }
 
-        content_types = [b.get("type") if isinstance(b, dict) else getattr(b, "type", "?") for b in content]
-        logger.info(f"[PTC] Built batch tool_use response: {len(thinking_blocks)} thinking blocks first, {len(batch_request)} tool calls, content_types={content_types}")
+        if logger.isEnabledFor(logging.INFO):
+            content_types = [b.get("type") if isinstance(b, dict) else getattr(b, "type", "?") for b in content]
+            logger.info(
+                "[PTC] Built batch tool_use response: %d thinking blocks first, %d tool calls, content_types=%s",
+                len(thinking_blocks), len(batch_request), content_types,
+            )
         return MessageResponse(**response_dict)
 
     async def _complete_code_execution(
@@ -2058,15 +2414,24 @@ Before writing code, verify:
         bedrock_service: Any,
         request_id: str,
         service_tier: str,
-        session: SandboxSession,
-        ptc_callable_tools: List[dict],
+        tools: Optional[List[Any]],
         anthropic_beta: Optional[str] = None,
-    ) -> Tuple[MessageResponse, Optional[ContainerInfo]]:
+        messages: Optional[List[Message]] = None,
+    ) -> Tuple[MessageResponse, List[Message]]:
         """
         Complete code execution and continue conversation with Claude.
 
         After code execution completes, send the result back to Claude
-        as a tool_result and get the final response.
+        as a tool_result and get the next response.
+
+        Args:
+            tools: Prepared Bedrock tools for the continuation request
+            messages: Continuation history from a previous round. When None,
+                the history is built from original_request.messages.
+
+        Returns:
+            Tuple of (Claude's response, continuation history). The history is
+            extended in place and can be passed back for the next round.
         """
         # Build tool result content
         if result.success:
@@ -2074,29 +2439,23 @@ Before writing code, verify:
         else:
             tool_result_content = f"Error: {result.stderr}"
 
-        # Build continuation messages
-        # Include original assistant response and tool result
-        # Filter out non-direct tool calls and their results from history
-        messages = _filter_non_direct_tool_calls(list(original_request.messages))
-
         # Add assistant message with execute_code call
         # Filter out server_tool_use/server_tool_result blocks - they're not valid for Bedrock
-        assistant_content = []
-        for block in claude_response.content:
-            if hasattr(block, "model_dump"):
-                assistant_content.append(block.model_dump())
-            elif isinstance(block, dict):
-                assistant_content.append(block)
+        assistant_content = [b for b in map(_block_to_dict, claude_response.content) if b is not None]
 
         filtered_assistant_content = _filter_content_blocks_for_bedrock(assistant_content)
-        logger.info(f"[PTC _complete] Filtered assistant content: {[b.get('type') for b in assistant_content]} -> {[b.get('type') for b in filtered_assistant_content]}")
-        messages.append({
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "[PTC _complete] Filtered assistant content: %s -> %s",
+                [b.get("type") for b in assistant_content], [b.get("type") for b in filtered_assistant_content],
+            )
+        assistant_message = Message.model_validate({
             "role": "assistant",
             "content": filtered_assistant_content
         })
 
         # Add tool result
-        messages.append({
+        tool_result_message = Message.model_validate({
             "role": "user",
             "content": [{
                 "type": "tool_result",
@@ -2105,17 +2464,33 @@ Before writing code, verify:
             }]
         })
 
+        # Build continuation messages
+        # Include original assistant response and tool result
+        # Filter out non-direct tool calls and their results from history
+        if messages is None:
+            # Sized list display: one allocation for history plus the new turn pair
+            messages = [
+                *_to_messages(_filter_non_direct_tool_calls(original_request.messages)),
+                assistant_message,
+                tool_result_message,
+            ]
+        else:
+            # New list: earlier rounds' requests keep referencing their own history
+            messages = [*messages, assistant_message, tool_result_message]
+
         # Debug: Log final messages before creating request
-        logger.info(f"[PTC _complete] Final messages ({len(messages)}):")
-        for idx, msg in enumerate(messages):
-            role = msg.get("role") if isinstance(msg, dict) else getattr(msg, "role", "?")
-            content = msg.get("content") if isinstance(msg, dict) else getattr(msg, "content", [])
-            if isinstance(content, list):
-                types = [b.get("type") if isinstance(b, dict) else getattr(b, "type", "?") for b in content]
-                logger.info(f"[PTC _complete]   messages[{idx}]: role={role}, content_types={types}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("[PTC _complete] Final messages (%d):", len(messages))
+            for idx, msg in enumerate(messages):
+                role = msg.get("role") if isinstance(msg, dict) else getattr(msg, "role", "?")
+                content = msg.get("content") if isinstance(msg, dict) else getattr(msg, "content", [])
+                if isinstance(content, list):
+                    types = [b.get("type") if isinstance(b, dict) else getattr(b, "type", "?") for b in content]
+                    logger.info("[PTC _complete]   messages[%d]: role=%s, content_types=%s", idx, role, types)
 
         # Create continuation request
-        continuation_request = MessageRequest(
+        # Messages are already validated, so skip re-validating the whole history
+        continuation_request = MessageRequest.model_construct(
             model=original_request.model,
             messages=messages,
             max_tokens=original_request.max_tokens,
@@ -2124,7 +2499,7 @@ Before writing code, verify:
             top_p=original_request.top_p,
             top_k=original_request.top_k,
             stop_sequences=original_request.stop_sequences,
-            tools=self.prepare_bedrock_request(original_request, ptc_callable_tools).tools,
+            tools=tools,
             tool_choice=original_request.tool_choice,
             thinking=original_request.thinking,
         )
@@ -2134,36 +2509,7 @@ Before writing code, verify:
             continuation_request, request_id, service_tier, anthropic_beta
         )
 
-        # Check if Claude called execute_code again
-        next_execute_code = self._find_execute_code_call(final_response)
-
-        if next_execute_code:
-            # Recursive call for multi-round code execution
-            # Build request with filtered tools (code_execution_20250825 removed)
-            recursive_request_dict = original_request.model_dump()
-            recursive_request_dict["messages"] = messages
-            recursive_request_dict["tools"] = self.prepare_bedrock_request(original_request, ptc_callable_tools).tools
-            return await self._handle_code_execution(
-                next_execute_code,
-                final_response,
-                session,
-                MessageRequest(**recursive_request_dict),
-                bedrock_service,
-                request_id,
-                service_tier,
-                ptc_callable_tools,
-                anthropic_beta,  # Pass beta header
-            )
-
-        # Add caller: {type: "direct"} to any direct tool_use blocks
-        final_response = self._add_direct_caller_to_tool_use(final_response)
-
-        container_info = ContainerInfo(
-            id=session.session_id,
-            expires_at=session.expires_at.isoformat()
-        )
-
-        return final_response, container_info
+        return final_response, messages
 
     def _add_direct_caller_to_tool_use(self, response: MessageResponse) -> MessageResponse:
         """
@@ -2172,57 +2518,64 @@ Before writing code, verify:
         When PTC is enabled, all tool_use blocks should have a caller field.
         Direct tool calls (not from code execution) get caller.type = "direct".
         """
-        new_content = []
-        modified = False
+        # Phase 1: cheap scan - most responses have no tool_use block missing a caller
+        missing = [_needs_direct_caller(block) for block in response.content]
+        if not any(missing):
+            return response
 
-        for block in response.content:
-            if hasattr(block, "type") and block.type == "tool_use":
-                # Check if already has caller
-                if not hasattr(block, "caller") or block.caller is None:
-                    # Convert to dict, add caller, and append
-                    block_dict = block.model_dump() if hasattr(block, "model_dump") else dict(block)
-                    block_dict["caller"] = {"type": "direct"}
-                    new_content.append(block_dict)
-                    modified = True
-                else:
-                    new_content.append(block.model_dump() if hasattr(block, "model_dump") else block)
-            elif isinstance(block, dict) and block.get("type") == "tool_use":
-                if "caller" not in block or block.get("caller") is None:
-                    block_copy = dict(block)
-                    block_copy["caller"] = {"type": "direct"}
-                    new_content.append(block_copy)
-                    modified = True
-                else:
-                    new_content.append(block)
+        # Phase 2: copy only the blocks missing a caller; the rest are shared with the
+        # original response, no re-validation
+        new_content = []
+        for block, needs_caller in zip(response.content, missing, strict=True):
+            if not needs_caller:
+                new_content.append(block)
+            elif isinstance(block, BaseModel):
+                new_content.append(block.model_copy(update={"caller": _DIRECT_CALLER}))
             else:
-                # Keep other content blocks as-is
-                if hasattr(block, "model_dump"):
-                    new_content.append(block.model_dump())
-                else:
-                    new_content.append(block)
+                new_content.append(ToolUseContent.model_validate({**block, "caller": _DIRECT_CALLER}))
+
+        return response.model_copy(update={"content": new_content})
 
-        if modified:
-            response_dict = response.model_dump()
-            response_dict["content"] = new_content
-            return MessageResponse(**response_dict)
+    def _register_pending_execution(
+        self,
+        session: SandboxSession,
+        state: PTCExecutionState,
+        gen: Any,
+        pending_call: ToolCallRequest,
+    ) -> None:
+        """
+        Park a paused sandbox execution until the client sends the tool result(s).
 
-        return response
+        Stores the execution state and generator for the session and marks the
+        session as waiting on pending_call (the first call of a batch).
+        """
+        session_id = session.session_id
+        self._ptc_sessions[session_id] = _PTCSession(state, gen)
+        session.pending_tool_call = PendingToolCall(
+            call_id=pending_call.call_id,
+            tool_name=pending_call.tool_name,
+            arguments=pending_call.arguments,
+            session_id=session_id,
+            code_execution_tool_id=state.code_execution_tool_id
+        )
 
     def get_pending_execution(self, session_id: str) -> Optional[PTCExecutionState]:
         """Get pending execution state for a session."""
-        return self._execution_states.get(session_id)
+        pending = self._ptc_sessions.get(session_id)
+        return pending.state if pending is not None else None
 
     # ========== Hybrid Streaming Support ==========
 
-    def _format_sse_event(self, event: Dict[str, Any]) -> str:
-        """Format an event dict as an SSE string."""
+    def _format_sse_event(self, event: Dict[str, Any]) -> bytes:
+        """Format an event dict as SSE bytes (already encoded for the response body)."""
         event_type = event.get("type", "unknown")
-        return f"event: {event_type}\ndata: {json.dumps(event)}\n\n"
+        prefix = _SSE_EVENT_PREFIXES.get(event_type) or b"event: %s\ndata: " % event_type.encode()
+        return b"%s%s\n\n" % (prefix, json.dumps(event).encode())
 
     def _emit_message_start(
         self, message_id: str, model: str, input_tokens: int,
         container_info: Optional[ContainerInfo] = None
-    ) -> str:
+    ) -> bytes:
         """Generate message_start SSE event."""
         message = {
             "id": message_id,
@@ -2253,32 +2606,47 @@ Before writing code, verify:
         return self._format_sse_event(event_data)
 
     def _emit_content_block_events(
-        self, content: List[Any], start_index: int
-    ) -> Tuple[List[str], int]:
-        """Generate SSE events for content blocks."""
-        events = []
+        self, content: Iterable[Any], start_index: int
+    ) -> Tuple[bytes, int]:
+        """
+        Generate SSE events for content blocks.
+
+        Blocks are consumed lazily (models or dicts, converted one at a time),
+        so callers pass response content directly instead of a dumped list.
+        All start/delta/stop frames are written into one buffer, so callers
+        yield a single chunk for the whole content.
+        """
+        buf = bytearray()
+
+        # Fast path: a single text block (plain answer) is filled into frame templates
+        if isinstance(content, list) and len(content) == 1 and _block_field(content[0], "type") == "text":
+            text = _block_field(content[0], "text") or ""
+            buf += _SSE_TEXT_BLOCK_START % start_index
+            if text:
+                buf += _SSE_TEXT_DELTA % (start_index, json.dumps(text).encode())
+            buf += _SSE_CONTENT_BLOCK_STOP % start_index
+            return bytes(buf), start_index + 1
+
         current_index = start_index
 
         for block in content:
-            block_dict = block if isinstance(block, dict) else (
-                block.model_dump() if hasattr(block, 'model_dump') else {}
-            )
+            block_dict = _block_to_dict(block) or {}
 
             block_type = block_dict.get("type", "")
 
             if block_type == "text":
-                events.append(self._format_sse_event({
+                buf += self._format_sse_event({
                     "type": "content_block_start",
                     "index": current_index,
                     "content_block": {"type": "text", "text": ""},
-                }))
+                })
                 text = block_dict.get("text", "")
                 if text:
-                    events.append(self._format_sse_event({
+                    buf += self._format_sse_event({
                         "type": "content_block_delta",
                         "index": current_index,
                         "delta": {"type": "text_delta", "text": text},
-                    }))
+                    })
 
             elif block_type == "server_tool_use":
                 # Include input in content_block_start for server_tool_use
@@ -2291,11 +2659,11 @@ Before writing code, verify:
                 if tool_input:
                     content_block["input"] = tool_input
 
-                events.append(self._format_sse_event({
+                buf += self._format_sse_event({
                     "type": "content_block_start",
                     "index": current_index,
                     "content_block": content_block,
-                }))
+                })
 
             elif block_type == "tool_use":
                 # Build content_block with caller and input
@@ -2307,67 +2675,146 @@ Before writing code, verify:
                 tool_input = block_dict.get("input", {})
                 if tool_input:
                     content_block["input"] = tool_input
-                caller = block_dict.get("caller")
-                if caller:
-                    content_block["caller"] = caller
+                # Tool calls without a caller were made by Claude directly
+                content_block["caller"] = block_dict.get("caller") or {"type": "direct"}
 
-                events.append(self._format_sse_event({
+                buf += self._format_sse_event({
                     "type": "content_block_start",
                     "index": current_index,
                     "content_block": content_block,
-                }))
+                })
 
             elif block_type in ("thinking", "redacted_thinking"):
-                events.append(self._format_sse_event({
+                buf += self._format_sse_event({
                     "type": "content_block_start",
                     "index": current_index,
                     "content_block": {"type": block_type, "thinking": "" if block_type == "thinking" else None},
-                }))
+                })
                 if block_type == "thinking":
                     thinking_text = block_dict.get("thinking", "")
                     if thinking_text:
-                        events.append(self._format_sse_event({
+                        buf += self._format_sse_event({
                             "type": "content_block_delta",
                             "index": current_index,
                             "delta": {"type": "thinking_delta", "thinking": thinking_text},
-                        }))
+                        })
 
             else:
                 # Handle other block types generically
-                events.append(self._format_sse_event({
+                buf += self._format_sse_event({
                     "type": "content_block_start",
                     "index": current_index,
                     "content_block": block_dict,
-                }))
+                })
 
-            events.append(self._format_sse_event({
-                "type": "content_block_stop",
-                "index": current_index,
-            }))
+            buf += _SSE_CONTENT_BLOCK_STOP % current_index
 
             current_index += 1
 
-        return events, current_index
+        return bytes(buf), current_index
 
     def _emit_message_end(
         self, stop_reason: str, output_tokens: int
-    ) -> List[str]:
-        """Generate message_delta and message_stop events."""
-        return [
-            self._format_sse_event({
-                "type": "message_delta",
-                "delta": {
-                    "stop_reason": stop_reason,
-                    "stop_sequence": None,
-                },
-                "usage": {
-                    "output_tokens": output_tokens,
-                },
-            }),
-            self._format_sse_event({
-                "type": "message_stop",
-            }),
-        ]
+    ) -> bytes:
+        """Generate message_delta and message_stop events as one chunk."""
+        return self._format_sse_event({
+            "type": "message_delta",
+            "delta": {
+                "stop_reason": stop_reason,
+                "stop_sequence": None,
+            },
+            "usage": {
+                "output_tokens": output_tokens,
+            },
+        }) + _SSE_MESSAGE_STOP
+
+    async def _relay_bedrock_stream(
+        self,
+        bedrock_service: Any,
+        bedrock_request: MessageRequest,
+        request_id: str,
+        service_tier: str,
+        anthropic_beta: Optional[str],
+        message_id: str,
+        model: str,
+        session_task: "asyncio.Task[SandboxSession]",
+        state: _BedrockStreamState,
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        Relay a streaming Bedrock response to the client as it is generated.
+
+        Emits our message_start (with container info, awaiting session_task at
+        that point) and passes text and thinking block events straight through.
+        From the first other block (e.g. tool_use) on, events are only
+        accumulated into state: whether they reach the client depends on
+        whether the turn calls execute_code. message_delta/message_stop are
+        never relayed, the caller ends the message.
+
+        Yields:
+            SSE-formatted event bytes
+        """
+        stream = bedrock_service.invoke_model_stream(
+            bedrock_request, request_id, service_tier, anthropic_beta
+        )
+        try:
+            async for frame in stream:
+                event = _parse_sse_data(frame)
+                if event is None:
+                    continue
+                event_type = event.get("type")
+
+                if event_type == "message_start":
+                    state.message = event.get("message") or {}
+                    input_tokens = (state.message.get("usage") or {}).get("input_tokens", 0)
+                    session = await session_task
+                    container_info = self._container_info(session)
+                    yield self._emit_message_start(message_id, model, input_tokens, container_info)
+
+                elif event_type == "content_block_start":
+                    block = dict(event.get("content_block") or {})
+                    state.blocks.append(block)
+                    block_index = len(state.blocks) - 1
+                    block_type = block.get("type")
+                    if (
+                        state.execute_code_index is None
+                        and block_type == "tool_use"
+                        and block.get("name") == "execute_code"
+                    ):
+                        state.execute_code_index = block_index
+                    if not state.holding and block_type not in _LIVE_BLOCK_TYPES:
+                        # Direct tool calls are dropped if the turn also calls execute_code
+                        state.held_from = block_index
+                    if not state.holding:
+                        yield self._format_sse_event(event)
+
+                elif event_type == "content_block_delta":
+                    state.apply_delta(event["index"], event.get("delta") or {})
+                    if not state.holding:
+                        yield self._format_sse_event(event)
+
+                elif event_type == "content_block_stop":
+                    state.finish_block(event["index"])
+                    if not state.holding:
+                        state.forwarded_blocks += 1
+                        yield _SSE_CONTENT_BLOCK_STOP % event["index"]
+
+                elif event_type == "message_delta":
+                    delta = event.get("delta") or {}
+                    state.stop_reason = delta.get("stop_reason")
+                    state.stop_sequence = delta.get("stop_sequence")
+                    state.output_tokens = (event.get("usage") or {}).get("output_tokens", 0)
+
+                elif event_type == "error":
+                    state.error = event
+                    yield self._format_sse_event(event)
+                    return
+
+                elif event_type == "ping" and not state.holding:
+                    yield self._format_sse_event(event)
+        finally:
+            # Release the Bedrock concurrency semaphore on early exit; the executor
+            # worker still reads the boto3 stream until Bedrock finishes it
+            await stream.aclose()
 
     async def handle_ptc_request_streaming(
         self,
@@ -2377,18 +2824,22 @@ Before writing code, verify:
         service_tier: str,
         container_id: Optional[str] = None,
         anthropic_beta: Optional[str] = None,
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[bytes, None]:
         """
         Handle PTC request with hybrid streaming.
 
-        Uses NON-STREAMING Bedrock API internally, but emits SSE events to the client.
+        The first Bedrock call is streamed through to the client as it is generated.
+        If Claude calls execute_code, the rest of that turn is held back and code
+        runs in the sandbox; continuation calls use the non-streaming Bedrock API
+        and are emitted as SSE events.
         When sandbox needs external tool call, emits events with stop_reason="tool_use"
         and returns - client will make a new request with tool_result.
 
         Yields:
-            SSE-formatted event strings
+            SSE-formatted event bytes
         """
         logger.info(f"[PTC Streaming] Handling request {request_id}")
+        yield _SSE_KEEPALIVE
 
         # Check Docker availability
         if not self.is_docker_available():
@@ -2401,7 +2852,7 @@ Before writing code, verify:
             })
             return
 
-        message_id = f"msg_{uuid4().hex[:24]}"
+        message_id = _generate_id("msg_", 12)
         global_index = 0
         total_input_tokens = 0
         total_output_tokens = 0
@@ -2409,67 +2860,90 @@ Before writing code, verify:
         # Get PTC tools
         _, ptc_callable_tools = self.get_ptc_tools(request)
 
-        # Prepare request for Bedrock
-        bedrock_request = self.prepare_bedrock_request(request, ptc_callable_tools)
+        # Get or create sandbox session in the background: container startup
+        # overlaps with request preparation and Bedrock's time to first event
+        session_task = asyncio.create_task(
+            self._get_or_create_session(container_id, ptc_callable_tools)
+        )
+        relay = None
 
         try:
-            # Get or create sandbox session
-            session = await self._get_or_create_session(container_id, ptc_callable_tools)
-            logger.info(f"[PTC Streaming] Using session {session.session_id}")
-
-            # Call Bedrock (non-streaming)
-            response = await bedrock_service.invoke_model(
-                bedrock_request, request_id, service_tier, anthropic_beta
+            # Prepare request for Bedrock
+            bedrock_request = self.prepare_bedrock_request(request, ptc_callable_tools)
+
+            # Call Bedrock (streaming) - emits message_start with container info and
+            # passes content blocks through until Claude calls execute_code
+            stream_state = _BedrockStreamState()
+            relay = self._relay_bedrock_stream(
+                bedrock_service, bedrock_request, request_id, service_tier, anthropic_beta,
+                message_id, request.model, session_task, stream_state,
             )
+            async for event in relay:
+                yield event
 
-            # Track tokens
-            if response.usage:
-                total_input_tokens += response.usage.input_tokens
-                total_output_tokens += response.usage.output_tokens
-
-            # Build container info
-            container_info = ContainerInfo(
-                id=session.session_id,
-                expires_at=session.expires_at.isoformat()
-            )
-
-            # Emit message_start with container info
-            yield self._emit_message_start(message_id, request.model, total_input_tokens, container_info)
-
-            # Check if Claude called execute_code
-            execute_code_call = self._find_execute_code_call(response)
+            if stream_state.error is not None:
+                return
+            if stream_state.stop_reason is None:
+                # Stream ended without message_delta: don't report a truncated
+                # response as a clean end_turn
+                yield self._format_sse_event({
+                    "type": "error",
+                    "error": {
+                        "type": "api_error",
+                        "message": "Bedrock stream ended without a stop reason",
+                    }
+                })
+                return
+            global_index = stream_state.forwarded_blocks
+
+            # Check if Claude called execute_code (recorded while relaying the stream)
+            execute_code_call = stream_state.execute_code_call
+
+            if not execute_code_call or stream_state.stop_reason != "tool_use":
+                # No code execution (or its input was cut off, e.g. at max_tokens) -
+                # emit the held-back blocks and finish the message. Direct tool calls
+                # are dropped when the turn also called execute_code.
+                held_blocks = stream_state.held_blocks
+                if execute_code_call:
+                    held_blocks = [b for b in held_blocks if b.get("type") != "tool_use"]
+                if held_blocks:
+                    events, global_index = self._emit_content_block_events(held_blocks, global_index)
+                    yield events
+                yield self._emit_message_end(stream_state.stop_reason, stream_state.output_tokens)
+                return
 
-            if not execute_code_call:
-                # No code execution - emit response and finish
-                response = self._add_direct_caller_to_tool_use(response)
-                content_list = []
-                for block in response.content:
-                    if hasattr(block, 'model_dump'):
-                        content_list.append(block.model_dump())
-                    else:
-                        content_list.append(block)
+            session = await session_task
+            logger.info(f"[PTC Streaming] Using session {session.session_id}")
 
-                events, global_index = self._emit_content_block_events(content_list, global_index)
-                for event in events:
-                    yield event
+            response = stream_state.to_response(message_id, request.model)
 
-                stop_reason = response.stop_reason or "end_turn"
-                for event in self._emit_message_end(stop_reason, total_output_tokens):
-                    yield event
-                return
+            # Track tokens
+            total_input_tokens += response.usage.input_tokens
+            total_output_tokens += response.usage.output_tokens
 
             # Execute code in sandbox
             code = execute_code_call.get("input", {}).get("code", "")
-            code_execution_tool_id = f"srvtoolu_{uuid4().hex[:12]}"
+            code_execution_tool_id = _sequential_id("srvtoolu_")
             original_execute_code_id = execute_code_call.get("id")
 
-            # Store original assistant content for continuation
+            # Store original assistant content for continuation, and collect the
+            # thinking/text blocks echoed to the client in the same pass
             original_assistant_content = []
-            for block in response.content:
-                if hasattr(block, "model_dump"):
-                    original_assistant_content.append(block.model_dump())
-                elif isinstance(block, dict):
-                    original_assistant_content.append(block)
+            thinking_blocks = []
+            text_blocks = []
+            for idx, block in enumerate(response.content):
+                block_dict = _block_to_dict(block)
+                if block_dict is None:
+                    continue
+                original_assistant_content.append(block_dict)
+                if idx < global_index:
+                    # Already streamed to the client before execute_code
+                    continue
+                block_type = block_dict.get("type")
+                if block_type in ("thinking", "redacted_thinking"):
+                    thinking_blocks.append(block_dict)
+                elif block_type == "text":
+                    text_blocks.append({"type": "text", "text": block_dict.get("text", "")})
 
             logger.info(f"[PTC Streaming] Executing code in sandbox")
 
@@ -2481,23 +2955,10 @@ Before writing code, verify:
 
                 if isinstance(result, (ToolCallRequest, BatchToolCallRequest)):
                     # Tool call(s) requested - emit events and return for client to execute
-                    container_info = ContainerInfo(
-                        id=session.session_id,
-                        expires_at=session.expires_at.isoformat()
-                    )
-
                     # Build content for response
                     content_blocks = []
 
                     # Add text from original response (thinking blocks first)
-                    thinking_blocks = []
-                    text_blocks = []
-                    for block in response.content:
-                        if hasattr(block, "type"):
-                            if block.type in ("thinking", "redacted_thinking"):
-                                thinking_blocks.append(block.model_dump() if hasattr(block, "model_dump") else block)
-                            elif block.type == "text":
-                                text_blocks.append({"type": "text", "text": block.text if hasattr(block, "text") else ""})
                     content_blocks.extend(thinking_blocks)
                     content_blocks.extend(text_blocks)
 
@@ -2547,22 +3008,15 @@ Before writing code, verify:
                             original_anthropic_beta=anthropic_beta,
                             original_assistant_content=original_assistant_content,
                             original_execute_code_id=original_execute_code_id,
+                            cached_tools=bedrock_request.tools,
                         )
-                        self._execution_states[session.session_id] = state
-                        self._execution_generators[session.session_id] = gen
-
-                        session.pending_tool_call = PendingToolCall(
-                            call_id=first_call.call_id,
-                            tool_name=first_call.tool_name,
-                            arguments=first_call.arguments,
-                            session_id=session.session_id,
-                            code_execution_tool_id=code_execution_tool_id
-                        )
+                        # Park the execution and mark the session as waiting on the tool call
+                        self._register_pending_execution(session, state, gen, first_call)
                     else:
                         # Single tool call
                         content_blocks.append({
                             "type": "tool_use",
-                            "id": f"toolu_{uuid4().hex[:12]}",
+                            "id": _sequential_id("toolu_"),
                             "name": result.tool_name,
                             "input": result.arguments,
                             "caller": {
@@ -2591,26 +3045,16 @@ Before writing code, verify:
                             original_anthropic_beta=anthropic_beta,
                             original_assistant_content=original_assistant_content,
                             original_execute_code_id=original_execute_code_id,
+                            cached_tools=bedrock_request.tools,
                         )
-                        self._execution_states[session.session_id] = state
-                        self._execution_generators[session.session_id] = gen
-
-                        session.pending_tool_call = PendingToolCall(
-                            call_id=result.call_id,
-                            tool_name=result.tool_name,
-                            arguments=result.arguments,
-                            session_id=session.session_id,
-                            code_execution_tool_id=code_execution_tool_id
-                        )
+                        # Park the execution and mark the session as waiting on the tool call
+                        self._register_pending_execution(session, state, gen, result)
 
                     # Emit content block events
                     events, global_index = self._emit_content_block_events(content_blocks, global_index)
-                    for event in events:
-                        yield event
-
-                    # Emit message end with stop_reason="tool_use"
-                    for event in self._emit_message_end("tool_use", total_output_tokens):
-                        yield event
+                    # Content blocks and message end go out together
+                    for chunk in _batch_sse_chunks(events, self._emit_message_end("tool_use", total_output_tokens)):
+                        yield chunk
                     return
 
                 elif isinstance(result, ExecutionResult):
@@ -2634,6 +3078,7 @@ Before writing code, verify:
                         start_index=global_index,
                         initial_input_tokens=total_input_tokens,
                         initial_output_tokens=total_output_tokens,
+                        assistant_content_dicts=original_assistant_content,
                     ):
                         yield event
                     return
@@ -2654,6 +3099,17 @@ Before writing code, verify:
             })
             return
 
+        finally:
+            # On errors or client disconnect, don't leave the Bedrock stream or
+            # the session creation running in the background
+            if relay is not None:
+                await relay.aclose()
+            if not session_task.done():
+                session_task.cancel()
+            elif not session_task.cancelled():
+                # Mark a failed session creation as retrieved
+                session_task.exception()
+
     async def handle_tool_result_continuation_streaming(
         self,
         session_id: str,
@@ -2663,23 +3119,24 @@ Before writing code, verify:
         bedrock_service: Any,
         request_id: str,
         service_tier: str,
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[bytes, None]:
         """
         Handle tool_result continuation with hybrid streaming.
 
         Resumes sandbox execution and emits SSE events.
 
         Yields:
-            SSE-formatted event strings
+            SSE-formatted event bytes
         """
-        state = self._execution_states.get(session_id)
+        yield _SSE_KEEPALIVE
+        state = self.get_pending_execution(session_id)
         if not state:
             # Provide detailed error for multi-instance routing issues
             import os
             instance_id = os.environ.get('HOSTNAME', os.environ.get('COMPUTERNAME', 'unknown'))
 
             logger.error(f"[PTC] Session {session_id} not found on instance {instance_id}")
-            logger.error(f"[PTC] Active sessions on this instance: {list(self._execution_states.keys())}")
+            logger.error(f"[PTC] Active sessions on this instance: {list(self._ptc_sessions.keys())}")
 
             error_message = (
                 f"PTC session '{session_id}' not found on this instance (instance_id: {instance_id}). "
@@ -2688,7 +3145,7 @@ Before writing code, verify:
                 f"(1) ALB sticky session expired (session timeout: {settings.ptc_session_timeout}s), "
                 f"(2) Instance was restarted and lost in-memory sessions, "
                 f"(3) Load balancer routed continuation request to a different instance. "
-                f"Active sessions on this instance: {len(self._execution_states)}. "
+                f"Active sessions on this instance: {len(self._ptc_sessions)}. "
                 f"Solution: Ensure ALB sticky sessions are enabled with sufficient duration, "
                 f"or create a new PTC session."
             )
@@ -2701,7 +3158,7 @@ Before writing code, verify:
 
         logger.info(f"[PTC Streaming] Resuming execution for session {session_id}")
 
-        message_id = f"msg_{uuid4().hex[:24]}"
+        message_id = _generate_id("msg_", 12)
         global_index = 0
         total_output_tokens = 0
 
@@ -2721,10 +3178,7 @@ Before writing code, verify:
                 return
 
             # Build container info
-            container_info = ContainerInfo(
-                id=session.session_id,
-                expires_at=session.expires_at.isoformat()
-            )
+            container_info = self._container_info(session)
 
             # Emit message_start with container info
             yield self._emit_message_start(message_id, original_request.model, 0, container_info)
@@ -2754,7 +3208,6 @@ Before writing code, verify:
                     state.pending_tool_call_id = first_call.call_id
                     state.pending_tool_name = first_call.tool_name
                     state.pending_tool_input = first_call.arguments
-                    self._execution_states[session_id] = state
 
                     session.pending_tool_call = PendingToolCall(
                         call_id=first_call.call_id,
@@ -2766,7 +3219,7 @@ Before writing code, verify:
                 else:
                     content_blocks.append({
                         "type": "tool_use",
-                        "id": f"toolu_{uuid4().hex[:12]}",
+                        "id": _sequential_id("toolu_"),
                         "name": result.tool_name,
                         "input": result.arguments,
                         "caller": {
@@ -2776,7 +3229,6 @@ Before writing code, verify:
                     })
 
                     state.pending_batch_call_ids = None
-                    self._execution_states[session_id] = state
 
                     session.pending_tool_call = PendingToolCall(
                         call_id=result.call_id,
@@ -2787,11 +3239,9 @@ Before writing code, verify:
                     )
 
                 events, global_index = self._emit_content_block_events(content_blocks, global_index)
-                for event in events:
-                    yield event
-
-                for event in self._emit_message_end("tool_use", 0):
-                    yield event
+                # Content blocks and message end go out together
+                for chunk in _batch_sse_chunks(events, self._emit_message_end("tool_use", 0)):
+                    yield chunk
                 return
 
             elif is_complete and isinstance(result, ExecutionResult):
@@ -2847,8 +3297,15 @@ Before writing code, verify:
         start_index: int,
         initial_input_tokens: int,
         initial_output_tokens: int,
-    ) -> AsyncGenerator[str, None]:
-        """Complete code execution and emit streaming events."""
+        assistant_content_dicts: Optional[List[dict]] = None,
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        Complete code execution and emit streaming events.
+
+        Args:
+            assistant_content_dicts: claude_response.content already converted to
+                dicts by the caller. Converted here when None.
+        """
         global_index = start_index
         total_input_tokens = initial_input_tokens
         total_output_tokens = initial_output_tokens
@@ -2859,15 +3316,14 @@ Before writing code, verify:
         else:
             tool_result_content = f"Error: {result.stderr}"
 
-        # Build continuation messages
-        messages = _filter_non_direct_tool_calls(list(original_request.messages))
+        # Build continuation messages (copy only if the filter passed the input through)
+        messages = _filter_non_direct_tool_calls(original_request.messages)
+        if messages is original_request.messages:
+            messages = list(messages)
 
-        assistant_content = []
-        for block in claude_response.content:
-            if hasattr(block, "model_dump"):
-                assistant_content.append(block.model_dump())
-            elif isinstance(block, dict):
-                assistant_content.append(block)
+        assistant_content = assistant_content_dicts
+        if assistant_content is None:
+            assistant_content = [_block_to_dict(block) for block in claude_response.content]
 
         filtered_assistant_content = _filter_content_blocks_for_bedrock(assistant_content)
         messages.append({
@@ -2885,16 +3341,18 @@ Before writing code, verify:
         })
 
         # Create continuation request
-        continuation_request = MessageRequest(
+        # Every field comes from the validated original request, so only the new
+        # messages are validated instead of the whole request
+        continuation_request = MessageRequest.model_construct(
             model=original_request.model,
-            messages=messages,
+            messages=_to_messages(messages),
             max_tokens=original_request.max_tokens,
             system=original_request.system,
             temperature=original_request.temperature,
             top_p=original_request.top_p,
             top_k=original_request.top_k,
             stop_sequences=original_request.stop_sequences,
-            tools=self.prepare_bedrock_request(original_request, ptc_callable_tools).tools,
+            tools=self._prepare_bedrock_tools(original_request.tools, ptc_callable_tools),
             tool_choice=original_request.tool_choice,
             thinking=original_request.thinking,
         )
@@ -2916,24 +3374,12 @@ Before writing code, verify:
             # Fall back to emitting the response as-is
             logger.warning("[PTC Streaming] Multi-round code execution not fully supported in streaming")
 
-        # Add direct caller to tool_use blocks
-        final_response = self._add_direct_caller_to_tool_use(final_response)
-
-        # Emit content blocks
-        content_list = []
-        for block in final_response.content:
-            if hasattr(block, 'model_dump'):
-                content_list.append(block.model_dump())
-            else:
-                content_list.append(block)
-
-        events, global_index = self._emit_content_block_events(content_list, global_index)
-        for event in events:
-            yield event
-
+        # Emit content blocks: each block is converted and direct callers are tagged in one pass
+        events, global_index = self._emit_content_block_events(final_response.content, global_index)
         stop_reason = final_response.stop_reason or "end_turn"
-        for event in self._emit_message_end(stop_reason, total_output_tokens):
-            yield event
+        # Content blocks and message end go out together
+        for chunk in _batch_sse_chunks(events, self._emit_message_end(stop_reason, total_output_tokens)):
+            yield chunk
 
     async def _finalize_code_execution_streaming(
         self,
@@ -2949,18 +3395,18 @@ Before writing code, verify:
         execution_state: PTCExecutionState,
         message_id: str,
         start_index: int,
-    ) -> AsyncGenerator[str, None]:
-        """Finalize code execution in continuation flow with streaming."""
+    ) -> AsyncGenerator[bytes, None]:
+        """
+        Finalize code execution in continuation flow with streaming.
+
+        Multi-round code execution runs as a loop: when Claude calls execute_code
+        again and the code completes without tool calls, the next round extends
+        the same history instead of re-entering this generator.
+        """
         global_index = start_index
         total_output_tokens = 0
 
-        # Build tool result content
-        if result.success:
-            tool_result_content = result.stdout or "(Code executed successfully with no output)"
-        else:
-            tool_result_content = f"Error: {result.stderr}"
-
-        # Use saved state parameters
+        # Use saved state parameters (shared by every round)
         effective_system = execution_state.original_system if execution_state.original_system is not None else original_request.system
         effective_model = execution_state.original_model or original_request.model
         effective_max_tokens = execution_state.original_max_tokens or original_request.max_tokens
@@ -2977,298 +3423,200 @@ Before writing code, verify:
         # from the client's echoed conversation. The client echoes tool_use blocks without the
         # 'caller' field (SDK strips it), so we can't distinguish PTC tool calls from direct calls.
         # We reconstruct the conversation using only the original user query and our stored state.
-        messages = []
-        msg_list = list(original_request.messages)
-
-        for i, msg in enumerate(msg_list):
-            if isinstance(msg, dict):
-                role = msg.get("role")
-                content = msg.get("content", [])
-            elif hasattr(msg, "role"):
-                role = msg.role
-                content = msg.content if hasattr(msg, "content") else []
-            else:
-                continue
+        # After an earlier round the history is already on the state, so only this round is appended.
+        if execution_state.messages is not None:
+            messages = execution_state.messages
+        else:
+            messages = []
+            append_message = messages.append
+            for msg in original_request.messages:
+                role, content = _extract_role_content(msg)
 
-            # Skip ALL assistant messages - we'll add our own stored content
-            # This avoids issues with tool_use blocks that don't have corresponding tool_results
-            if role == "assistant":
-                continue
+                # Skip ALL assistant messages - we'll add our own stored content
+                # This avoids issues with tool_use blocks that don't have corresponding tool_results
+                if role is None or role == "assistant":
+                    continue
 
-            # Skip user messages with tool_result - those are for PTC tool calls
-            if role == "user" and isinstance(content, list):
-                has_tool_result = any(
-                    (isinstance(b, dict) and b.get("type") == "tool_result") or
-                    (hasattr(b, "type") and b.type == "tool_result")
-                    for b in content
-                )
-                if has_tool_result:
+                # Skip user messages with tool_result - those are for PTC tool calls
+                if role == "user" and type(content) is list and _has_tool_result(content):
                     continue
 
-            msg_dict = msg if isinstance(msg, dict) else msg.model_dump()
-            messages.append(msg_dict)
+                # Validated Message models are kept as-is; _to_messages passes them through
+                append_message(msg)
 
-        # Append stored assistant content
-        if execution_state.original_assistant_content:
-            filtered_assistant_content = _filter_content_blocks_for_bedrock(
-                execution_state.original_assistant_content
-            )
-            messages.append({
-                "role": "assistant",
-                "content": filtered_assistant_content
-            })
-            execute_code_id = execution_state.original_execute_code_id or f"toolu_{code_execution_tool_id[-12:]}"
-        else:
-            execute_code_id = f"toolu_{code_execution_tool_id[-12:]}"
-            messages.append({
-                "role": "assistant",
+        # Tools are prepared once per continuation and carried over to later rounds
+        prepared_tools = execution_state.cached_tools
+        if prepared_tools is None:
+            prepared_tools = self._prepare_bedrock_tools(original_request.tools, ptc_callable_tools)
+
+        # Per-round inputs: the first round comes from the saved state
+        assistant_content = execution_state.original_assistant_content
+        assistant_execute_code_id = execution_state.original_execute_code_id
+
+        while True:
+            # Build tool result content
+            if result.success:
+                tool_result_content = result.stdout or "(Code executed successfully with no output)"
+            else:
+                tool_result_content = f"Error: {result.stderr}"
+
+            # Append stored assistant content
+            if assistant_content:
+                assistant_message = {
+                    "role": "assistant",
+                    "content": _filter_content_blocks_for_bedrock(assistant_content)
+                }
+                execute_code_id = assistant_execute_code_id or f"toolu_{code_execution_tool_id[-12:]}"
+            else:
+                execute_code_id = f"toolu_{code_execution_tool_id[-12:]}"
+                assistant_message = {
+                    "role": "assistant",
+                    "content": [{
+                        "type": "tool_use",
+                        "id": execute_code_id,
+                        "name": "execute_code",
+                        "input": {"code": code}
+                    }]
+                }
+
+            # Add tool result
+            tool_result_message = {
+                "role": "user",
                 "content": [{
-                    "type": "tool_use",
-                    "id": execute_code_id,
-                    "name": "execute_code",
-                    "input": {"code": code}
+                    "type": "tool_result",
+                    "tool_use_id": execute_code_id,
+                    "content": tool_result_content
                 }]
-            })
-
-        # Add tool result
-        messages.append({
-            "role": "user",
-            "content": [{
-                "type": "tool_result",
-                "tool_use_id": execute_code_id,
-                "content": tool_result_content
-            }]
-        })
+            }
 
-        # Create continuation request
-        continuation_request = MessageRequest(
-            model=effective_model,
-            messages=messages,
-            max_tokens=effective_max_tokens,
-            system=effective_system,
-            temperature=effective_temperature,
-            top_p=effective_top_p,
-            top_k=effective_top_k,
-            stop_sequences=effective_stop_sequences,
-            tools=self.prepare_bedrock_request(original_request, ptc_callable_tools).tools,
-            tool_choice=effective_tool_choice,
-            thinking=effective_thinking,
-        )
+            # Create continuation request
+            # Parameters come from the validated original request (saved on the state) and the
+            # history is validated message by message, so the request itself skips validation.
+            # A new list per round keeps earlier requests' messages unchanged.
+            messages = _to_messages([*messages, assistant_message, tool_result_message])
+            continuation_request = MessageRequest.model_construct(
+                model=effective_model,
+                messages=messages,
+                max_tokens=effective_max_tokens,
+                system=effective_system,
+                temperature=effective_temperature,
+                top_p=effective_top_p,
+                top_k=effective_top_k,
+                stop_sequences=effective_stop_sequences,
+                tools=prepared_tools,
+                tool_choice=effective_tool_choice,
+                thinking=effective_thinking,
+            )
 
-        # Call Bedrock
-        final_response = await bedrock_service.invoke_model(
-            continuation_request, request_id, service_tier, effective_anthropic_beta
-        )
+            # Call Bedrock
+            final_response = await bedrock_service.invoke_model(
+                continuation_request, request_id, service_tier, effective_anthropic_beta
+            )
 
-        if final_response.usage:
-            total_output_tokens += final_response.usage.output_tokens
+            if final_response.usage:
+                total_output_tokens += final_response.usage.output_tokens
 
-        # Check if Claude called execute_code again (recursive code execution)
-        next_execute_code = self._find_execute_code_call(final_response)
+            # Check if Claude called execute_code again (multi-round code execution)
+            next_execute_code = self._find_execute_code_call(final_response)
+            if not next_execute_code:
+                break
 
-        if next_execute_code:
-            # Recursive handling for multi-round code execution
-            logger.info("[PTC Streaming] Claude requested another code execution, handling recursively")
+            logger.info("[PTC Streaming] Claude requested another code execution, running next round")
 
             # Execute the new code in sandbox
             new_code = next_execute_code.get("input", {}).get("code", "")
-            new_code_execution_tool_id = f"srvtoolu_{uuid4().hex[:12]}"
+            new_code_execution_tool_id = _sequential_id("srvtoolu_")
 
             # Store new assistant content for potential further continuation
-            new_assistant_content = []
-            for block in final_response.content:
-                if hasattr(block, "model_dump"):
-                    new_assistant_content.append(block.model_dump())
-                elif isinstance(block, dict):
-                    new_assistant_content.append(block)
+            new_assistant_content = [_block_to_dict(block) for block in final_response.content]
 
             gen = self.sandbox_executor.execute_code(new_code, session)
 
             try:
                 new_result = await gen.__anext__()
+            except StopAsyncIteration:
+                # Generator completed without yielding
+                await gen.aclose()
+                session.is_busy = False
+                logger.warning("Sandbox generator completed unexpectedly")
+                raise SandboxError("Code execution completed unexpectedly")
 
-                if isinstance(new_result, (ToolCallRequest, BatchToolCallRequest)):
-                    # Tool call(s) requested - emit events and return
-                    content_blocks = []
+            if isinstance(new_result, (ToolCallRequest, BatchToolCallRequest)):
+                # Tool call(s) requested - emit events and return
+                content_blocks = []
 
-                    # Add text from response
-                    for block in final_response.content:
-                        if hasattr(block, "type"):
-                            if block.type == "text":
-                                content_blocks.append({"type": "text", "text": block.text if hasattr(block, "text") else ""})
+                # Add text from response
+                for block in final_response.content:
+                    if hasattr(block, "type"):
+                        if block.type == "text":
+                            content_blocks.append({"type": "text", "text": block.text if hasattr(block, "text") else ""})
 
-                    # Add server_tool_use for code_execution
+                # Add server_tool_use for code_execution
+                content_blocks.append({
+                    "type": "server_tool_use",
+                    "id": new_code_execution_tool_id,
+                    "name": "code_execution",
+                    "input": {"code": new_code}
+                })
+
+                # Add tool_use block(s) for client execution
+                is_batch = isinstance(new_result, BatchToolCallRequest)
+                tool_requests = new_result.requests if is_batch else [new_result]
+                for tool_request in tool_requests:
                     content_blocks.append({
-                        "type": "server_tool_use",
-                        "id": new_code_execution_tool_id,
-                        "name": "code_execution",
-                        "input": {"code": new_code}
+                        "type": "tool_use",
+                        # Batch IDs are derived from call_id to map results back to calls
+                        "id": f"toolu_{tool_request.call_id[:12]}" if is_batch else _sequential_id("toolu_"),
+                        "name": tool_request.tool_name,
+                        "input": tool_request.arguments,
+                        "caller": {
+                            "type": PTC_ALLOWED_CALLER,
+                            "tool_id": new_code_execution_tool_id
+                        }
                     })
 
-                    # Add tool_use block(s) for client execution
-                    if isinstance(new_result, BatchToolCallRequest):
-                        pending_call_ids = [r.call_id for r in new_result.requests]
-                        first_call = new_result.requests[0]
-
-                        for tool_request in new_result.requests:
-                            content_blocks.append({
-                                "type": "tool_use",
-                                "id": f"toolu_{tool_request.call_id[:12]}",
-                                "name": tool_request.tool_name,
-                                "input": tool_request.arguments,
-                                "caller": {
-                                    "type": PTC_ALLOWED_CALLER,
-                                    "tool_id": new_code_execution_tool_id
-                                }
-                            })
-
-                        # Store state for continuation
-                        new_state = PTCExecutionState(
-                            session_id=session.session_id,
-                            code_execution_tool_id=new_code_execution_tool_id,
-                            code=new_code,
-                            pending_tool_call_id=first_call.call_id,
-                            pending_tool_name=first_call.tool_name,
-                            pending_tool_input=first_call.arguments,
-                            pending_batch_call_ids=pending_call_ids,
-                            original_system=execution_state.original_system,
-                            original_model=execution_state.original_model,
-                            original_max_tokens=execution_state.original_max_tokens,
-                            original_temperature=execution_state.original_temperature,
-                            original_top_p=execution_state.original_top_p,
-                            original_top_k=execution_state.original_top_k,
-                            original_stop_sequences=execution_state.original_stop_sequences,
-                            original_tool_choice=execution_state.original_tool_choice,
-                            original_thinking=execution_state.original_thinking,
-                            original_anthropic_beta=effective_anthropic_beta,
-                            original_assistant_content=new_assistant_content,
-                            original_execute_code_id=next_execute_code.get("id"),
-                        )
-                        self._execution_states[session.session_id] = new_state
-                        self._execution_generators[session.session_id] = gen
-
-                        session.pending_tool_call = PendingToolCall(
-                            call_id=first_call.call_id,
-                            tool_name=first_call.tool_name,
-                            arguments=first_call.arguments,
-                            session_id=session.session_id,
-                            code_execution_tool_id=new_code_execution_tool_id
-                        )
-                    else:
-                        # Single tool call
-                        content_blocks.append({
-                            "type": "tool_use",
-                            "id": f"toolu_{uuid4().hex[:12]}",
-                            "name": new_result.tool_name,
-                            "input": new_result.arguments,
-                            "caller": {
-                                "type": PTC_ALLOWED_CALLER,
-                                "tool_id": new_code_execution_tool_id
-                            }
-                        })
-
-                        # Store state for continuation
-                        new_state = PTCExecutionState(
-                            session_id=session.session_id,
-                            code_execution_tool_id=new_code_execution_tool_id,
-                            code=new_code,
-                            pending_tool_call_id=new_result.call_id,
-                            pending_tool_name=new_result.tool_name,
-                            pending_tool_input=new_result.arguments,
-                            original_system=execution_state.original_system,
-                            original_model=execution_state.original_model,
-                            original_max_tokens=execution_state.original_max_tokens,
-                            original_temperature=execution_state.original_temperature,
-                            original_top_p=execution_state.original_top_p,
-                            original_top_k=execution_state.original_top_k,
-                            original_stop_sequences=execution_state.original_stop_sequences,
-                            original_tool_choice=execution_state.original_tool_choice,
-                            original_thinking=execution_state.original_thinking,
-                            original_anthropic_beta=effective_anthropic_beta,
-                            original_assistant_content=new_assistant_content,
-                            original_execute_code_id=next_execute_code.get("id"),
-                        )
-                        self._execution_states[session.session_id] = new_state
-                        self._execution_generators[session.session_id] = gen
-
-                        session.pending_tool_call = PendingToolCall(
-                            call_id=new_result.call_id,
-                            tool_name=new_result.tool_name,
-                            arguments=new_result.arguments,
-                            session_id=session.session_id,
-                            code_execution_tool_id=new_code_execution_tool_id
-                        )
-
-                    # Emit content block events
-                    events, global_index = self._emit_content_block_events(content_blocks, global_index)
-                    for event in events:
-                        yield event
-
-                    # Emit message end with stop_reason="tool_use"
-                    for event in self._emit_message_end("tool_use", total_output_tokens):
-                        yield event
-                    return
-
-                elif isinstance(new_result, ExecutionResult):
-                    # Code completed - recursively call finalize
-                    async for event in self._finalize_code_execution_streaming(
-                        result=new_result,
-                        code_execution_tool_id=new_code_execution_tool_id,
-                        original_request=original_request,
-                        bedrock_service=bedrock_service,
-                        request_id=request_id,
-                        service_tier=service_tier,
-                        session=session,
-                        ptc_callable_tools=ptc_callable_tools,
-                        code=new_code,
-                        execution_state=PTCExecutionState(
-                            session_id=session.session_id,
-                            code_execution_tool_id=new_code_execution_tool_id,
-                            code=new_code,
-                            pending_tool_call_id="",
-                            pending_tool_name="",
-                            pending_tool_input={},
-                            original_system=execution_state.original_system,
-                            original_model=execution_state.original_model,
-                            original_max_tokens=execution_state.original_max_tokens,
-                            original_temperature=execution_state.original_temperature,
-                            original_top_p=execution_state.original_top_p,
-                            original_top_k=execution_state.original_top_k,
-                            original_stop_sequences=execution_state.original_stop_sequences,
-                            original_tool_choice=execution_state.original_tool_choice,
-                            original_thinking=execution_state.original_thinking,
-                            original_anthropic_beta=effective_anthropic_beta,
-                            original_assistant_content=new_assistant_content,
-                            original_execute_code_id=next_execute_code.get("id"),
-                        ),
-                        message_id=message_id,
-                        start_index=global_index,
-                    ):
-                        yield event
-                    return
-
-            except StopAsyncIteration:
-                # Code completed without tool calls
-                pass
+                # Store state for continuation: the saved parameters carry over unchanged,
+                # so the session's state is updated in place for the next round
+                first_call = tool_requests[0]
+                execution_state.code_execution_tool_id = new_code_execution_tool_id
+                execution_state.code = new_code
+                execution_state.pending_tool_call_id = first_call.call_id
+                execution_state.pending_tool_name = first_call.tool_name
+                execution_state.pending_tool_input = first_call.arguments
+                execution_state.pending_batch_call_ids = [r.call_id for r in tool_requests] if is_batch else None
+                execution_state.original_assistant_content = new_assistant_content
+                execution_state.original_execute_code_id = next_execute_code.get("id")
+                execution_state.messages = messages
+                execution_state.cached_tools = prepared_tools
+                self._register_pending_execution(session, execution_state, gen, first_call)
+
+                # Emit content block events
+                events, global_index = self._emit_content_block_events(content_blocks, global_index)
+                # Content blocks and message end go out together
+                for chunk in _batch_sse_chunks(events, self._emit_message_end("tool_use", total_output_tokens)):
+                    yield chunk
+                return
 
-        # Add direct caller to tool_use blocks
-        final_response = self._add_direct_caller_to_tool_use(final_response)
+            # Close the generator to trigger its finally block (clears is_busy)
+            await gen.aclose()
+            session.is_busy = False  # Explicitly clear just in case
 
-        # Emit content blocks
-        content_list = []
-        for block in final_response.content:
-            if hasattr(block, 'model_dump'):
-                content_list.append(block.model_dump())
-            else:
-                content_list.append(block)
+            if not isinstance(new_result, ExecutionResult):
+                raise SandboxError(f"Unexpected result type: {type(new_result)}")
 
-        events, global_index = self._emit_content_block_events(content_list, global_index)
-        for event in events:
-            yield event
+            # Code completed - run the next round with its result
+            result = new_result
+            code = new_code
+            code_execution_tool_id = new_code_execution_tool_id
+            assistant_content = new_assistant_content
+            assistant_execute_code_id = next_execute_code.get("id")
 
+        # Emit content blocks: each block is converted and direct callers are tagged in one pass
+        events, global_index = self._emit_content_block_events(final_response.content, global_index)
         stop_reason = final_response.stop_reason or "end_turn"
-        for event in self._emit_message_end(stop_reason, total_output_tokens):
-            yield event
+        # Content blocks and message end go out together
+        for chunk in _batch_sse_chunks(events, self._emit_message_end(stop_reason, total_output_tokens)):
+            yield chunk
 
     async def shutdown(self) -> None:
         """Shutdown PTC service and cleanup resources."""
@@ -0,0 +1,947 @@
+"""
+Unit tests for the Programmatic Tool Calling (PTC) service.
+
+Uses in-memory fakes for the Docker sandbox and Bedrock service so the
+orchestration logic can be tested without external dependencies.
+"""
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.schemas.anthropic import Message, MessageRequest, MessageResponse
+from app.services.ptc import (
+    BatchToolCallRequest,
+    ExecutionResult,
+    SandboxSession,
+    ToolCallRequest,
+)
+from app.services.ptc_service import (
+    _DUMP_OPTS,
+    _SSE_CONTENT_BLOCK_STOP,
+    _SSE_MESSAGE_STOP,
+    PTCService,
+    _batch_sse_chunks,
+    _block_to_dict,
+    _filter_content_blocks_for_bedrock,
+    _filter_non_direct_tool_calls,
+    _has_tool_result,
+    _sequential_id,
+    _split_thinking_and_text,
+)
+
+
+def _make_session(session_id: str = "container_test") -> SandboxSession:
+    now = datetime.now()
+    return SandboxSession(
+        session_id=session_id,
+        container=None,
+        socket=None,
+        created_at=now,
+        expires_at=now + timedelta(minutes=5),
+        last_used_at=now,
+    )
+
+
+def _make_response(content, stop_reason: str = "end_turn") -> MessageResponse:
+    return MessageResponse(
+        id="msg_test",
+        content=content,
+        model="claude-test",
+        stop_reason=stop_reason,
+        usage={"input_tokens": 10, "output_tokens": 5},
+    )
+
+
+def _execute_code_response(tool_use_id: str, code: str) -> MessageResponse:
+    return _make_response(
+        [
+            {"type": "text", "text": "Running code"},
+            {"type": "tool_use", "id": tool_use_id, "name": "execute_code", "input": {"code": code}},
+        ],
+        stop_reason="tool_use",
+    )
+
+
+def _execution_result(stdout: str) -> ExecutionResult:
+    return ExecutionResult(success=True, stdout=stdout, stderr="", return_code=0)
+
+
+class FakeSandboxExecutor:
+    """Sandbox executor that replays scripted results for each execute_code call."""
+
+    def __init__(self, rounds):
+        self.rounds = list(rounds)
+        self.executed_code = []
+        self.session = _make_session()
+
+    def is_docker_available(self) -> bool:
+        return True
+
+    def get_session(self, session_id):
+        return self.session if session_id == self.session.session_id else None
+
+    async def create_session(self, tools):
+        return self.session
+
+    async def close_session(self, session_id):
+        return True
+
+    async def execute_code(self, code, session):
+        self.executed_code.append(code)
+        session.is_busy = True
+        try:
+            for result in self.rounds.pop(0):
+                yield result
+        finally:
+            session.is_busy = False
+
+
+class FakeBedrockService:
+    """Bedrock service that returns scripted responses and records requests."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    async def invoke_model(self, request, request_id, service_tier, anthropic_beta=None):
+        self.requests.append(request)
+        return self.responses.pop(0)
+
+    async def invoke_model_stream(self, request, request_id, service_tier, anthropic_beta=None):
+        self.requests.append(request)
+        for event in _stream_events(self.responses.pop(0)):
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def _stream_events(response: MessageResponse):
+    """Split a response into the native Anthropic stream events Bedrock emits."""
+    yield {"type": "message_start", "message": {
+        "id": response.id, "type": "message", "role": "assistant", "content": [], "model": response.model,
+        "usage": {"input_tokens": response.usage.input_tokens, "output_tokens": 0},
+    }}
+    for index, block in enumerate(response.content):
+        if block.type == "text":
+            yield {"type": "content_block_start", "index": index, "content_block": {"type": "text", "text": ""}}
+            yield {"type": "content_block_delta", "index": index, "delta": {"type": "text_delta", "text": block.text}}
+        else:
+            start = {"type": "tool_use", "id": block.id, "name": block.name, "input": {}}
+            yield {"type": "content_block_start", "index": index, "content_block": start}
+            yield {
+                "type": "content_block_delta", "index": index,
+                "delta": {"type": "input_json_delta", "partial_json": json.dumps(block.input)},
+            }
+        yield {"type": "content_block_stop", "index": index}
+    yield {
+        "type": "message_delta",
+        "delta": {"stop_reason": response.stop_reason, "stop_sequence": None},
+        "usage": {"output_tokens": response.usage.output_tokens},
+    }
+    yield {"type": "message_stop"}
+
+
+@pytest.fixture
+def ptc_request():
+    """PTC request with code execution and one programmatically callable tool."""
+    return MessageRequest(
+        model="claude-test",
+        max_tokens=1024,
+        messages=[{"role": "user", "content": "Summarize the sales data"}],
+        tools=[
+            {"type": "code_execution_20250825", "name": "code_execution"},
+            {
+                "name": "query_sales",
+                "description": "Query sales data",
+                "input_schema": {"type": "object", "properties": {"region": {"type": "string"}}},
+                "allowed_callers": ["code_execution_20250825"],
+            },
+        ],
+    )
+
+
+class TestPTCCodeExecution:
+    """Test non-streaming code execution orchestration."""
+
+    def setup_method(self):
+        """Setup test fixtures."""
+        self.service = PTCService()
+
+    async def test_multi_round_code_execution(self, ptc_request):
+        """Test that repeated execute_code calls extend a single history."""
+        self.service._sandbox_executor = FakeSandboxExecutor([
+            [_execution_result("first")],
+            [_execution_result("second")],
+        ])
+        bedrock = FakeBedrockService([
+            _execute_code_response("toolu_one", "print('first')"),
+            _execute_code_response("toolu_two", "print('second')"),
+            _make_response([{"type": "text", "text": "Done"}]),
+        ])
+
+        response, container_info = await self.service.handle_ptc_request(
+            ptc_request, bedrock, "req_test", "default"
+        )
+
+        assert response.content[0].text == "Done"
+        assert container_info.id == "container_test"
+        assert self.service.sandbox_executor.executed_code == ["print('first')", "print('second')"]
+        assert len(bedrock.requests) == 3
+
+        final_messages = bedrock.requests[-1].messages
+        assert all(isinstance(msg, Message) for msg in final_messages)
+        assert [msg.role for msg in final_messages] == [
+            "user", "assistant", "user", "assistant", "user"
+        ]
+        assert final_messages[2].content[0].tool_use_id == "toolu_one"
+        assert final_messages[2].content[0].content == "first"
+        assert final_messages[4].content[0].tool_use_id == "toolu_two"
+        assert final_messages[4].content[0].content == "second"
+
+    async def test_earlier_round_request_keeps_its_history(self, ptc_request):
+        """Test that a later round does not extend the messages of a request already sent."""
+        self.service._sandbox_executor = FakeSandboxExecutor([
+            [_execution_result("first")],
+            [_execution_result("second")],
+        ])
+        bedrock = FakeBedrockService([
+            _execute_code_response("toolu_one", "print('first')"),
+            _execute_code_response("toolu_two", "print('second')"),
+            _make_response([{"type": "text", "text": "Done"}]),
+        ])
+
+        await self.service.handle_ptc_request(ptc_request, bedrock, "req_test", "default")
+
+        assert bedrock.requests[1].messages is not bedrock.requests[2].messages
+        assert len(bedrock.requests[1].messages) == 3
+        assert len(bedrock.requests[2].messages) == 5
+
+    async def test_tool_call_returned_to_client(self, ptc_request):
+        """Test that a sandbox tool call is returned as a tool_use block with caller."""
+        self.service._sandbox_executor = FakeSandboxExecutor([
+            [ToolCallRequest(call_id="call_1", tool_name="query_sales", arguments={"region": "East"})],
+        ])
+        bedrock = FakeBedrockService([
+            _execute_code_response("toolu_one", "await query_sales(region='East')"),
+        ])
+
+        response, _ = await self.service.handle_ptc_request(
+            ptc_request, bedrock, "req_test", "default"
+        )
+
+        assert response.stop_reason == "tool_use"
+        assert [block.type for block in response.content] == ["text", "server_tool_use", "tool_use"]
+        tool_use = response.content[-1]
+        assert tool_use.name == "query_sales"
+        assert tool_use.caller.type == "code_execution_20250825"
+        assert tool_use.caller.tool_id == response.content[1].id
+
+        state = self.service.get_pending_execution("container_test")
+        assert state is not None
+        assert state.pending_tool_call_id == "call_1"
+        assert state.original_execute_code_id == "toolu_one"
+
+    async def test_tool_result_continuation_rebuilds_history(self, ptc_request):
+        """Test that a continuation replaces the echoed turn with the stored assistant content."""
+        self.service._sandbox_executor = FakeSandboxExecutor([
+            [
+                ToolCallRequest(call_id="call_1", tool_name="query_sales", arguments={"region": "East"}),
+                _execution_result("East: 100"),
+            ],
+        ])
+        bedrock = FakeBedrockService([
+            _execute_code_response("toolu_one", "print(await query_sales(region='East'))"),
+            _make_response([{"type": "text", "text": "East sold 100"}]),
+        ])
+
+        tool_use_response, _ = await self.service.handle_ptc_request(
+            ptc_request, bedrock, "req_test", "default"
+        )
+        tool_use_id = tool_use_response.content[-1].id
+
+        # Client echoes the conversation with its tool_result (SDK strips 'caller')
+        continuation_request = ptc_request.model_copy(update={"messages": [
+            ptc_request.messages[0],
+            Message.model_validate({"role": "assistant", "content": [
+                {"type": "text", "text": "Running code"},
+                {"type": "tool_use", "id": tool_use_id, "name": "query_sales", "input": {"region": "East"}},
+            ]}),
+            Message.model_validate({"role": "user", "content": [
+                {"type": "tool_result", "tool_use_id": tool_use_id, "content": "100"},
+            ]}),
+        ]})
+
+        response, _ = await self.service.handle_tool_result_continuation(
+            "container_test", "100", False, continuation_request, bedrock, "req_test", "default"
+        )
+
+        assert response.content[0].text == "East sold 100"
+        final_messages = bedrock.requests[-1].messages
+        assert [msg.role for msg in final_messages] == ["user", "assistant", "user"]
+        assert [block.type for block in final_messages[1].content] == ["text", "tool_use"]
+        assert final_messages[1].content[1].id == "toolu_one"
+        assert final_messages[2].content[0].tool_use_id == "toolu_one"
+        assert final_messages[2].content[0].content == "East: 100"
+        assert self.service.get_pending_execution("container_test") is None
+
+    async def test_continuation_hands_next_round_to_execution_loop(self, ptc_request):
+        """Test that execute_code after a tool_result continuation extends the rebuilt history."""
+        self.service._sandbox_executor = FakeSandboxExecutor([
+            [
+                ToolCallRequest(call_id="call_1", tool_name="query_sales", arguments={"region": "East"}),
+                _execution_result("East: 100"),
+            ],
+            [_execution_result("doubled: 200")],
+        ])
+        bedrock = FakeBedrockService([
+            _execute_code_response("toolu_one", "print(await query_sales(region='East'))"),
+            _execute_code_response("toolu_two", "print(200)"),
+            _make_response([{"type": "text", "text": "Doubled is 200"}]),
+        ])
+
+        tool_use_response, _ = await self.service.handle_ptc_request(
+            ptc_request, bedrock, "req_test", "default"
+        )
+        tool_use_id = tool_use_response.content[-1].id
+        continuation_request = ptc_request.model_copy(update={"messages": [
+            ptc_request.messages[0],
+            Message.model_validate({"role": "assistant", "content": [
+                {"type": "tool_use", "id": tool_use_id, "name": "query_sales", "input": {"region": "East"}},
+            ]}),
+            Message.model_validate({"role": "user", "content": [
+                {"type": "tool_result", "tool_use_id": tool_use_id, "content": "100"},
+            ]}),
+        ]})
+
+        response, container_info = await self.service.handle_tool_result_continuation(
+            "container_test", "100", False, continuation_request, bedrock, "req_test", "default"
+        )
+
+        assert response.content[0].text == "Doubled is 200"
+        assert container_info.id == "container_test"
+        final_messages = bedrock.requests[-1].messages
+        assert [msg.role for msg in final_messages] == ["user", "assistant", "user", "assistant", "user"]
+        assert final_messages[2].content[0].content == "East: 100"
+        assert final_messages[4].content[0].tool_use_id == "toolu_two"
+        assert final_messages[4].content[0].content == "doubled: 200"
+        assert bedrock.requests[-1].tools == bedrock.requests[-2].tools
+
+    async def test_continuation_appends_to_stored_history(self, ptc_request):
+        """Test that a tool call in a later round keeps earlier rounds in the continuation history."""
+        self.service._sandbox_executor = FakeSandboxExecutor([
+            [_execution_result("first")],
+            [
+                ToolCallRequest(call_id="call_1", tool_name="query_sales", arguments={"region": "East"}),
+                _execution_result("East: 100"),
+            ],
+        ])
+        bedrock = FakeBedrockService([
+            _execute_code_response("toolu_one", "print('first')"),
+            _execute_code_response("toolu_two", "print(await query_sales(region='East'))"),
+            _make_response([{"type": "text", "text": "East sold 100"}]),
+        ])
+
+        tool_use_response, _ = await self.service.handle_ptc_request(
+            ptc_request, bedrock, "req_test", "default"
+        )
+        state = self.service.get_pending_execution("container_test")
+        assert [msg.role for msg in state.messages] == ["user", "assistant", "user"]
+
+        tool_use_id = tool_use_response.content[-1].id
+        continuation_request = ptc_request.model_copy(update={"messages": [
+            ptc_request.messages[0],
+            Message.model_validate({"role": "assistant", "content": [
+                {"type": "tool_use", "id": tool_use_id, "name": "query_sales", "input": {"region": "East"}},
+            ]}),
+            Message.model_validate({"role": "user", "content": [
+                {"type": "tool_result", "tool_use_id": tool_use_id, "content": "100"},
+            ]}),
+        ]})
+
+        response, _ = await self.service.handle_tool_result_continuation(
+            "container_test", "100", False, continuation_request, bedrock, "req_test", "default"
+        )
+
+        assert response.content[0].text == "East sold 100"
+        final_messages = bedrock.requests[-1].messages
+        assert [msg.role for msg in final_messages] == ["user", "assistant", "user", "assistant", "user"]
+        assert final_messages[2].content[0].content == "first"
+        assert final_messages[4].content[0].tool_use_id == "toolu_two"
+        assert final_messages[4].content[0].content == "East: 100"
+
+
+async def _collect_sse(stream):
+    """Collect an SSE byte stream into a list of (event_type, data) pairs."""
+    chunks = [chunk async for chunk in stream]
+    assert all(isinstance(chunk, bytes) for chunk in chunks)
+    events = []
+    for frame in b"".join(chunks).decode().split("\n\n"):
+        if not frame or frame.startswith(":"):
+            continue
+        event_line, data_line = frame.split("\n")
+        events.append((event_line[len("event: "):], json.loads(data_line[len("data: "):])))
+    return events
+
+
+class TestPTCStreaming:
+    """Test SSE emission for streaming PTC requests."""
+
+    def setup_method(self):
+        """Setup test fixtures."""
+        self.service = PTCService()
+
+    async def test_code_execution_streamed_as_sse_bytes(self, ptc_request):
+        """Test that a code execution round is emitted as well-formed SSE events."""
+        self.service._sandbox_executor = FakeSandboxExecutor([[_execution_result("42")]])
+        bedrock = FakeBedrockService([
+            _execute_code_response("toolu_one", "print(42)"),
+            _make_response([{"type": "text", "text": "The answer is 42"}]),
+        ])
+
+        events = await _collect_sse(self.service.handle_ptc_request_streaming(
+            ptc_request, bedrock, "req_test", "default"
+        ))
+
+        # First-round text is streamed live; the execute_code call itself is held back
+        assert [event_type for event_type, _ in events] == [
+            "message_start",
+            "content_block_start", "content_block_delta", "content_block_stop",
+            "content_block_start", "content_block_delta", "content_block_stop",
+            "message_delta", "message_stop",
+        ]
+        assert events[0][1]["message"]["container"]["id"] == "container_test"
+        assert events[2][1]["delta"]["text"] == "Running code"
+        assert events[5][1]["index"] == 1
+        assert events[5][1]["delta"]["text"] == "The answer is 42"
+        assert events[7][1]["delta"]["stop_reason"] == "end_turn"
+        assert self.service.sandbox_executor.executed_code == ["print(42)"]
+
+    async def test_plain_response_streamed_through(self, ptc_request):
+        """Test that a response without code execution is relayed from the Bedrock stream."""
+        self.service._sandbox_executor = FakeSandboxExecutor([])
+        bedrock = FakeBedrockService([
+            _make_response(
+                [
+                    {"type": "text", "text": "Let me check"},
+                    {"type": "tool_use", "id": "toolu_1", "name": "query_sales", "input": {"region": "East"}},
+                ],
+                stop_reason="tool_use",
+            ),
+        ])
+
+        events = await _collect_sse(self.service.handle_ptc_request_streaming(
+            ptc_request, bedrock, "req_test", "default"
+        ))
+
+        assert [event_type for event_type, _ in events][-2:] == ["message_delta", "message_stop"]
+        tool_use = events[4][1]["content_block"]
+        assert tool_use["name"] == "query_sales"
+        assert tool_use["caller"] == {"type": "direct"}
+        assert tool_use["input"] == {"region": "East"}
+        assert events[-2][1]["delta"]["stop_reason"] == "tool_use"
+        assert events[-2][1]["usage"]["output_tokens"] == 5
+
+    async def test_direct_tool_call_dropped_when_execute_code_called(self, ptc_request):
+        """Test that a direct tool_use before execute_code is held back and not shown to the client."""
+        self.service._sandbox_executor = FakeSandboxExecutor([[_execution_result("42")]])
+        bedrock = FakeBedrockService([
+            _make_response(
+                [
+                    {"type": "text", "text": "Running code"},
+                    {"type": "tool_use", "id": "toolu_direct", "name": "query_sales", "input": {"region": "East"}},
+                    {"type": "tool_use", "id": "toolu_one", "name": "execute_code", "input": {"code": "print(42)"}},
+                ],
+                stop_reason="tool_use",
+            ),
+            _make_response([{"type": "text", "text": "The answer is 42"}]),
+        ])
+
+        events = await _collect_sse(self.service.handle_ptc_request_streaming(
+            ptc_request, bedrock, "req_test", "default"
+        ))
+
+        blocks = [data["content_block"] for event_type, data in events if event_type == "content_block_start"]
+        assert [block["type"] for block in blocks] == ["text", "text"]
+        assert [data["index"] for event_type, data in events if event_type == "content_block_stop"] == [0, 1]
+        assert events[-2][1]["delta"]["stop_reason"] == "end_turn"
+        assert self.service.sandbox_executor.executed_code == ["print(42)"]
+
+    async def test_bedrock_error_cancels_session_creation(self, ptc_request):
+        """Test that a stream error closes the Bedrock stream and cancels pending session creation."""
+        started = asyncio.Event()
+        cancelled = []
+        closed = []
+
+        class SlowSandboxExecutor(FakeSandboxExecutor):
+            async def create_session(self, tools):
+                started.set()
+                try:
+                    await asyncio.Event().wait()
+                except asyncio.CancelledError:
+                    cancelled.append(True)
+                    raise
+
+        class ErrorBedrockService(FakeBedrockService):
+            async def invoke_model_stream(self, request, request_id, service_tier, anthropic_beta=None):
+                try:
+                    await started.wait()
+                    error = {"type": "error", "error": {"type": "overloaded_error", "message": "busy"}}
+                    yield f"event: error\ndata: {json.dumps(error)}\n\n"
+                    yield "event: ping\ndata: {\"type\": \"ping\"}\n\n"
+                finally:
+                    closed.append(True)
+
+        self.service._sandbox_executor = SlowSandboxExecutor([])
+        events = await asyncio.wait_for(_collect_sse(self.service.handle_ptc_request_streaming(
+            ptc_request, ErrorBedrockService([]), "req_test", "default"
+        )), timeout=5)
+        await asyncio.sleep(0)
+
+        assert [event_type for event_type, _ in events] == ["error"]
+        assert closed == [True]
+        assert cancelled == [True]
+
+    async def test_cut_off_tool_input_relays_max_tokens(self, ptc_request):
+        """Test that execute_code input cut off at max_tokens ends the message instead of running code."""
+        class CutOffBedrockService(FakeBedrockService):
+            async def invoke_model_stream(self, request, request_id, service_tier, anthropic_beta=None):
+                events = list(_stream_events(_execute_code_response("toolu_one", "print(42)")))
+                events[5]["delta"]["partial_json"] = '{"code": "pri'
+                events[-2]["delta"]["stop_reason"] = "max_tokens"
+                for event in events:
+                    yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+        self.service._sandbox_executor = FakeSandboxExecutor([])
+        events = await _collect_sse(self.service.handle_ptc_request_streaming(
+            ptc_request, CutOffBedrockService([]), "req_test", "default"
+        ))
+
+        assert [event_type for event_type, _ in events] == [
+            "message_start",
+            "content_block_start", "content_block_delta", "content_block_stop",
+            "message_delta", "message_stop",
+        ]
+        assert events[-2][1]["delta"]["stop_reason"] == "max_tokens"
+        assert self.service.sandbox_executor.executed_code == []
+
+    async def test_stream_without_stop_reason_reported_as_error(self, ptc_request):
+        """Test that a Bedrock stream ending before message_delta is not reported as end_turn."""
+        class TruncatedBedrockService(FakeBedrockService):
+            async def invoke_model_stream(self, request, request_id, service_tier, anthropic_beta=None):
+                for event in list(_stream_events(_make_response([{"type": "text", "text": "hi"}])))[:-2]:
+                    yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+        self.service._sandbox_executor = FakeSandboxExecutor([])
+        events = await _collect_sse(self.service.handle_ptc_request_streaming(
+            ptc_request, TruncatedBedrockService([]), "req_test", "default"
+        ))
+
+        assert events[-1][0] == "error"
+        assert "message_delta" not in [event_type for event_type, _ in events]
+
+    async def test_keepalive_comment_sent_first(self, ptc_request):
+        """Test that both streaming entry points open with an SSE comment frame."""
+        self.service._sandbox_executor = FakeSandboxExecutor([])
+        bedrock = FakeBedrockService([_make_response([{"type": "text", "text": "hi"}])])
+
+        stream = self.service.handle_ptc_request_streaming(ptc_request, bedrock, "req_test", "default")
+        assert await stream.__anext__() == b": keepalive\n\n"
+        await stream.aclose()
+
+        continuation = self.service.handle_tool_result_continuation_streaming(
+            "unknown_session", "100", False, ptc_request, bedrock, "req_test", "default"
+        )
+        chunks = [chunk async for chunk in continuation]
+        assert chunks[0] == b": keepalive\n\n"
+        assert chunks[1].startswith(b"event: error\n")
+
+    async def test_tool_call_streamed_to_client(self, ptc_request):
+        """Test that a sandbox tool call is streamed as server_tool_use + tool_use blocks."""
+        self.service._sandbox_executor = FakeSandboxExecutor([
+            [ToolCallRequest(call_id="call_1", tool_name="query_sales", arguments={"region": "East"})],
+        ])
+        bedrock = FakeBedrockService([
+            _execute_code_response("toolu_one", "await query_sales(region='East')"),
+        ])
+
+        events = await _collect_sse(self.service.handle_ptc_request_streaming(
+            ptc_request, bedrock, "req_test", "default"
+        ))
+
+        blocks = [data["content_block"] for event_type, data in events if event_type == "content_block_start"]
+        assert [block["type"] for block in blocks] == ["text", "server_tool_use", "tool_use"]
+        assert blocks[2]["name"] == "query_sales"
+        assert blocks[2]["caller"] == {"type": "code_execution_20250825", "tool_id": blocks[1]["id"]}
+        assert events[-2][1]["delta"]["stop_reason"] == "tool_use"
+
+        state = self.service.get_pending_execution("container_test")
+        assert state.pending_tool_call_id == "call_1"
+        assert [block["type"] for block in state.original_assistant_content] == ["text", "tool_use"]
+
+    async def test_multi_round_continuation_reuses_history(self, ptc_request):
+        """Test that a further execute_code round extends the history built by the continuation."""
+        self.service._sandbox_executor = FakeSandboxExecutor([
+            [
+                ToolCallRequest(call_id="call_1", tool_name="query_sales", arguments={"region": "East"}),
+                _execution_result("East: 100"),
+            ],
+            [_execution_result("doubled: 200")],
+        ])
+        bedrock = FakeBedrockService([
+            _execute_code_response("toolu_one", "print(await query_sales(region='East'))"),
+            _execute_code_response("toolu_two", "print(200)"),
+            _make_response([{"type": "text", "text": "Doubled is 200"}]),
+        ])
+
+        await _collect_sse(self.service.handle_ptc_request_streaming(
+            ptc_request, bedrock, "req_test", "default"
+        ))
+        continuation_request = ptc_request.model_copy(update={"messages": [
+            ptc_request.messages[0],
+            Message.model_validate({"role": "assistant", "content": [
+                {"type": "tool_use", "id": "toolu_call_1", "name": "query_sales", "input": {"region": "East"}},
+            ]}),
+            Message.model_validate({"role": "user", "content": [
+                {"type": "tool_result", "tool_use_id": "toolu_call_1", "content": "100"},
+            ]}),
+        ]})
+
+        events = await _collect_sse(self.service.handle_tool_result_continuation_streaming(
+            "container_test", "100", False, continuation_request, bedrock, "req_test", "default"
+        ))
+
+        assert events[-2][1]["delta"]["stop_reason"] == "end_turn"
+        final_messages = bedrock.requests[-1].messages
+        assert all(isinstance(msg, Message) for msg in final_messages)
+        assert [msg.role for msg in final_messages] == ["user", "assistant", "user", "assistant", "user"]
+        assert final_messages[2].content[0].tool_use_id == "toolu_one"
+        assert final_messages[2].content[0].content == "East: 100"
+        assert final_messages[4].content[0].tool_use_id == "toolu_two"
+        assert final_messages[4].content[0].content == "doubled: 200"
+        assert bedrock.requests[-1].tools == bedrock.requests[0].tools
+        # The next round builds a new history list instead of extending the previous request's
+        assert len(bedrock.requests[-2].messages) == 3
+
+    async def test_later_round_execution_results_release_session(self, ptc_request):
+        """Test that sandbox rounds completing in the streaming finalize loop are closed."""
+        self.service._sandbox_executor = FakeSandboxExecutor([
+            [
+                ToolCallRequest(call_id="call_1", tool_name="query_sales", arguments={"region": "East"}),
+                _execution_result("East: 100"),
+            ],
+            [_execution_result("doubled: 200")],
+            [_execution_result("tripled: 300")],
+        ])
+        bedrock = FakeBedrockService([
+            _execute_code_response("toolu_one", "print(await query_sales(region='East'))"),
+            _execute_code_response("toolu_two", "print(200)"),
+            _execute_code_response("toolu_three", "print(300)"),
+            _make_response([{"type": "text", "text": "Tripled is 300"}]),
+        ])
+
+        await _collect_sse(self.service.handle_ptc_request_streaming(
+            ptc_request, bedrock, "req_test", "default"
+        ))
+        events = await _collect_sse(self.service.handle_tool_result_continuation_streaming(
+            "container_test", "100", False, ptc_request, bedrock, "req_test", "default"
+        ))
+
+        assert events[-2][1]["delta"]["stop_reason"] == "end_turn"
+        assert len(self.service.sandbox_executor.executed_code) == 3
+        assert self.service.sandbox_executor.session.is_busy is False
+
+    async def test_batch_tool_calls_in_later_round_registered(self, ptc_request):
+        """Test that a batch of tool calls from a later round is parked for the next continuation."""
+        self.service._sandbox_executor = FakeSandboxExecutor([
+            [
+                ToolCallRequest(call_id="call_1", tool_name="query_sales", arguments={"region": "East"}),
+                _execution_result("East: 100"),
+            ],
+            [BatchToolCallRequest(requests=[
+                ToolCallRequest(call_id="call_west_0001", tool_name="query_sales", arguments={"region": "West"}),
+                ToolCallRequest(call_id="call_north_001", tool_name="query_sales", arguments={"region": "North"}),
+            ])],
+        ])
+        bedrock = FakeBedrockService([
+            _execute_code_response("toolu_one", "print(await query_sales(region='East'))"),
+            _execute_code_response("toolu_two", "await asyncio.gather(...)"),
+        ])
+
+        await _collect_sse(self.service.handle_ptc_request_streaming(
+            ptc_request, bedrock, "req_test", "default"
+        ))
+        first_state = self.service.get_pending_execution("container_test")
+        events = await _collect_sse(self.service.handle_tool_result_continuation_streaming(
+            "container_test", "100", False, ptc_request, bedrock, "req_test", "default"
+        ))
+
+        blocks = [data["content_block"] for event_type, data in events if event_type == "content_block_start"]
+        assert [block["type"] for block in blocks] == ["text", "server_tool_use", "tool_use", "tool_use"]
+        assert [block["id"] for block in blocks[2:]] == ["toolu_call_west_00", "toolu_call_north_0"]
+        assert events[-2][1]["delta"]["stop_reason"] == "tool_use"
+
+        state = self.service.get_pending_execution("container_test")
+        assert state is first_state
+        assert state.code_execution_tool_id == blocks[1]["id"]
+        assert state.pending_batch_call_ids == ["call_west_0001", "call_north_001"]
+        assert state.original_execute_code_id == "toolu_two"
+        session = self.service.sandbox_executor.session
+        assert session.pending_tool_call.call_id == "call_west_0001"
+        assert session.pending_tool_call.code_execution_tool_id == blocks[1]["id"]
+
+    def test_content_block_frames_joined_into_one_chunk(self):
+        """Test that all content block frames are emitted as a single chunk."""
+        events, next_index = self.service._emit_content_block_events(
+            [{"type": "text", "text": "hi"}, {"type": "tool_use", "id": "toolu_1", "name": "f", "input": {}}], 3
+        )
+
+        assert next_index == 5
+        assert isinstance(events, bytes)
+        frames = [frame for frame in events.split(b"\n\n") if frame]
+        assert len(frames) == 5
+        tool_use_start = json.loads(frames[3].split(b"\n")[1][len(b"data: "):])
+        assert tool_use_start["content_block"]["caller"] == {"type": "direct"}
+
+    def test_model_blocks_tagged_with_direct_caller(self):
+        """Test that response model blocks are converted and tagged in the same pass."""
+        response = _make_response(
+            [
+                {"type": "text", "text": "Let me check"},
+                {"type": "tool_use", "id": "toolu_1", "name": "query_sales", "input": {"region": "East"}},
+            ],
+            stop_reason="tool_use",
+        )
+
+        events, _ = self.service._emit_content_block_events(response.content, 0)
+
+        frames = [json.loads(frame.split(b"\n")[1][len(b"data: "):]) for frame in events.split(b"\n\n") if frame]
+        tool_use = frames[3]["content_block"]
+        assert tool_use["input"] == {"region": "East"}
+        assert tool_use["caller"] == {"type": "direct"}
+        assert response.content[1].caller is None
+
+    def test_single_text_block_fast_path_matches_generic_frames(self):
+        """Test that the single-text-block fast path emits the same bytes as the generic loop."""
+        text_block = {"type": "text", "text": 'Say "hi"\nthen ☃'}
+        thinking_block = {"type": "thinking", "thinking": "hmm"}
+
+        fast, fast_index = self.service._emit_content_block_events([text_block], 2)
+        generic, _ = self.service._emit_content_block_events([thinking_block, text_block], 1)
+
+        assert fast_index == 3
+        assert generic.endswith(fast)
+
+    def test_content_blocks_consumed_from_iterator(self):
+        """Test that blocks can be streamed from an iterator without building a list."""
+        blocks = [{"type": "text", "text": "one"}, {"type": "text", "text": "two"}]
+
+        from_list, list_index = self.service._emit_content_block_events(blocks, 0)
+        from_iter, iter_index = self.service._emit_content_block_events(iter(blocks), 0)
+
+        assert from_iter == from_list
+        assert iter_index == list_index == 2
+
+    def test_sse_chunks_batched_up_to_limit(self):
+        """Test that small chunks are joined and an oversized chunk is kept whole."""
+        small, large = b"a" * 4, b"b" * 20
+
+        assert _batch_sse_chunks(small, small, max_bytes=10) == [small + small]
+        assert _batch_sse_chunks(small, large, small, max_bytes=10) == [small, large, small]
+        assert _batch_sse_chunks(small, b"", max_bytes=10) == [small]
+
+    def test_precomputed_frames_match_formatter(self):
+        """Test that constant SSE frames are byte-identical to formatted events."""
+        assert _SSE_MESSAGE_STOP == self.service._format_sse_event({"type": "message_stop"})
+        assert _SSE_CONTENT_BLOCK_STOP % 4 == self.service._format_sse_event(
+            {"type": "content_block_stop", "index": 4}
+        )
+
+
+class TestAddDirectCaller:
+    """Test tagging of direct tool calls in PTC responses."""
+
+    def test_direct_caller_added_without_touching_other_blocks(self):
+        """Test that tool_use blocks without caller get caller.type direct."""
+        response = _make_response(
+            [
+                {"type": "text", "text": "Looking up"},
+                {"type": "tool_use", "id": "toolu_1", "name": "query_sales", "input": {}},
+            ],
+            stop_reason="tool_use",
+        )
+
+        tagged = PTCService()._add_direct_caller_to_tool_use(response)
+
+        assert tagged.content[1].caller.type == "direct"
+        assert tagged.content[0] is response.content[0]
+        assert response.content[1].caller is None
+        assert tagged.model_dump()["content"][1]["caller"] == {"type": "direct", "tool_id": None}
+
+    def test_response_without_missing_callers_returned_unchanged(self):
+        """Test that responses whose tool_use blocks all have callers are not copied."""
+        response = _make_response(
+            [
+                {"type": "text", "text": "Looking up"},
+                {"type": "tool_use", "id": "toolu_1", "name": "f", "input": {}, "caller": {"type": "direct"}},
+            ],
+            stop_reason="tool_use",
+        )
+
+        assert PTCService()._add_direct_caller_to_tool_use(response) is response
+
+
+class TestBlockToDict:
+    """Test the field projection used instead of model_dump for response blocks."""
+
+    def test_matches_model_dump(self):
+        """Test that projected blocks equal their model_dump output."""
+        response = _make_response([
+            {"type": "thinking", "thinking": "hmm", "signature": "sig"},
+            {"type": "redacted_thinking", "data": "abc"},
+            {"type": "text", "text": "hi"},
+            {"type": "server_tool_use", "id": "srvtoolu_1", "name": "code_execution", "input": {"code": "1"}},
+            {"type": "tool_use", "id": "toolu_1", "name": "f", "input": {"a": 1}},
+            {"type": "tool_use", "id": "toolu_2", "name": "f", "input": {}, "caller": {"type": "direct"}},
+        ])
+
+        for block in response.content:
+            assert _block_to_dict(block) == block.model_dump(**_DUMP_OPTS)
+
+    def test_dict_returned_unchanged(self):
+        """Test that dict blocks are passed through."""
+        block = {"type": "text", "text": "hi"}
+        assert _block_to_dict(block) is block
+
+    def test_non_block_values_give_none(self):
+        """Test that values that are neither dicts nor models convert to None."""
+        assert _block_to_dict("text") is None
+
+    async def test_stored_assistant_content_matches_streaming_shape(self, ptc_request):
+        """Test that non-streaming stores assistant content in the exclude-none shape."""
+        service = PTCService()
+        service._sandbox_executor = FakeSandboxExecutor([
+            [ToolCallRequest(call_id="call_1", tool_name="query_sales", arguments={"region": "East"})],
+        ])
+        response = _execute_code_response("toolu_one", "await query_sales(region='East')")
+        bedrock = FakeBedrockService([response])
+
+        await service.handle_ptc_request(ptc_request, bedrock, "req_test", "default")
+
+        state = service.get_pending_execution("container_test")
+        assert state.original_assistant_content == [_block_to_dict(block) for block in response.content]
+        assert all(None not in block.values() for block in state.original_assistant_content)
+
+
+class TestHasToolResult:
+    """Test the tool_result scan over dict and model content blocks."""
+
+    def test_detects_dict_and_model_blocks(self):
+        """Test that tool_result blocks are found as dicts or models, and missed otherwise."""
+        message = Message(role="user", content=[
+            {"type": "text", "text": "hi"},
+            {"type": "tool_result", "tool_use_id": "toolu_1", "content": "ok"},
+        ])
+
+        assert _has_tool_result(message.content)
+        assert _has_tool_result([{"type": "text", "text": "hi"}, {"type": "tool_result"}])
+        assert not _has_tool_result([{"type": "text", "text": "hi"}, "tool_result"])
+
+
+class TestSequentialId:
+    """Test the prefix + counter tool ID generator."""
+
+    def test_ids_unique_with_fixed_length(self):
+        """Test that IDs keep the toolu_<16 hex> shape and never repeat."""
+        ids = [_sequential_id("toolu_") for _ in range(1000)]
+        assert len(set(ids)) == len(ids)
+        for tool_id in ids:
+            assert tool_id.startswith("toolu_")
+            suffix = tool_id[len("toolu_"):]
+            assert len(suffix) == 16
+            int(suffix, 16)
+
+
+class TestFilterContentBlocks:
+    """Test content block filtering for Bedrock."""
+
+    def test_thinking_blocks_first_and_server_blocks_removed(self):
+        """Test that thinking blocks are moved first and server tool blocks dropped."""
+        blocks = [
+            {"type": "text", "text": "hi"},
+            {"type": "server_tool_use", "id": "srvtoolu_1", "name": "code_execution", "input": {}},
+            {"type": "thinking", "thinking": "hmm", "signature": "sig"},
+            {"type": "tool_use", "id": "toolu_1", "name": "f", "input": {}, "caller": {"type": "direct"}},
+            {
+                "type": "tool_use", "id": "toolu_2", "name": "g", "input": {},
+                "caller": {"type": "code_execution_20250825", "tool_id": "srvtoolu_1"},
+            },
+        ]
+
+        filtered = _filter_content_blocks_for_bedrock(blocks)
+
+        assert [b["type"] for b in filtered] == ["thinking", "text", "tool_use"]
+        assert filtered[2]["id"] == "toolu_1"
+        assert "caller" not in filtered[2]
+
+    def test_already_valid_blocks_returned_unchanged(self):
+        """Test that the input list is returned as-is when nothing needs filtering."""
+        blocks = [
+            {"type": "thinking", "thinking": "hmm", "signature": "sig"},
+            {"type": "text", "text": "hi"},
+            {"type": "tool_use", "id": "toolu_1", "name": "f", "input": {}},
+        ]
+
+        assert _filter_content_blocks_for_bedrock(blocks) is blocks
+
+    def test_split_thinking_and_text(self):
+        """Test that thinking and text blocks are split and other blocks dropped."""
+        response = _make_response([
+            {"type": "thinking", "thinking": "hmm", "signature": "sig"},
+            {"type": "text", "text": "hi"},
+            {"type": "tool_use", "id": "toolu_1", "name": "f", "input": {}},
+        ])
+        dict_blocks = [{"type": "redacted_thinking", "data": "abc"}, {"type": "text", "text": "there"}]
+
+        thinking, text = _split_thinking_and_text(response.content + dict_blocks)
+
+        assert thinking == [
+            {"type": "thinking", "thinking": "hmm", "signature": "sig"},
+            {"type": "redacted_thinking", "data": "abc"},
+        ]
+        assert text == [{"type": "text", "text": "hi"}, {"type": "text", "text": "there"}]
+
+
+class TestFilterNonDirectToolCalls:
+    """Test history filtering of sandbox-originated tool calls."""
+
+    def test_history_without_candidates_returned_unchanged(self):
+        """Test that the input list is passed through when nothing needs filtering."""
+        messages = [
+            Message.model_validate({"role": "user", "content": "hi"}),
+            Message.model_validate({"role": "assistant", "content": [
+                {"type": "tool_use", "id": "toolu_1", "name": "f", "input": {}},
+            ]}),
+        ]
+
+        assert _filter_non_direct_tool_calls(messages) is messages
+
+    def test_non_direct_tool_calls_removed(self):
+        """Test that sandbox tool calls and their results are dropped from model messages."""
+        messages = [
+            Message.model_validate({"role": "assistant", "content": [
+                {"type": "text", "text": "calling"},
+                {
+                    "type": "tool_use", "id": "toolu_1", "name": "f", "input": {},
+                    "caller": {"type": "code_execution_20250825", "tool_id": "srvtoolu_1"},
+                },
+            ]}),
+            Message.model_validate({"role": "user", "content": [
+                {"type": "tool_result", "tool_use_id": "toolu_1", "content": "ok"},
+            ]}),
+        ]
+
+        filtered = _filter_non_direct_tool_calls(messages)
+
+        assert len(filtered) == 1
+        assert filtered[0]["role"] == "assistant"
+        assert [b["type"] for b in filtered[0]["content"]] == ["text"]